@@ -1,34 +1,362 @@
-from flask import Flask, flash, redirect, render_template, request, session, jsonify
-from flask_session import Session
+from flask import Blueprint, Flask, Response, appcontext_pushed, current_app, flash, has_request_context, redirect, render_template, request, session, jsonify, make_response, url_for, stream_with_context
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
 from tempfile import mkdtemp
-from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy import create_engine, or_, desc
-from sqlalchemy.orm import sessionmaker, aliased
-from models import User, Task, Status, Priority, Comment, STATUSES, Notification
-from forms import LoginForm, RegisterForm, ChangePasswordForm, TaskForm, EditTaskForm, CommentForm, SearchTaskForm
-from flask_wtf.csrf import CSRFProtect
-from functools import wraps
-
-# Configure application
-app = Flask(__name__)
-
-# Configure session to use filesystem (instead of signed cookies)
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SECRET_KEY"] = "some secret key"
-Session(app)
+import os
+import atexit
+import io
+import threading
+import click
+from sqlalchemy import bindparam, desc, event, func, insert, select, tuple_
+from sqlalchemy.orm import sessionmaker, scoped_session
+from models import DATABASE_URL, create_db, create_db_engine, User, Task, TaskEvent, Comment, PRIORITY_LEVELS, STATUSES, Notification, NOTIFICATION_KINDS
+from search import filter_tasks_by_text, text_search_rank
+from autocomplete import UsernameIndex
+from cache import LRUCache, SQLiteStore, MISSING, cache_metrics_lines
+from sessions import init_sessions, regenerate_session
+from notifications import NotificationBroker, NotificationWriter, archive_notifications, insert_notifications, keep_notification_titles, notification_to_dict
+from bulk_tasks import FORMATS, get_format, import_tasks, read_rows, task_to_row, write_rows
+from instrumentation import SQLInstrumentation
+from passwords import PasswordHasher
+from replicas import RoutingSession, SQLiteBackupReplica
+from task_counts import apply_task_count_deltas, get_overdue_count, get_task_counts, task_count_deltas
+from task_events import event_to_dict, get_task_events, task_events
+from due_dates import filter_tasks_by_due_date
+from reminders import ReminderScheduler
+from pagination import InvalidCursor, get_page_size, keyset_statements, paginate, paginate_statements
+from forms import LoginForm, RegisterForm, ChangePasswordForm, TaskForm, EditTaskForm, CommentForm, SearchTaskForm, TASK_SORTS
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from functools import wraps, lru_cache
+import hashlib
+import time
+from datetime import date, datetime, timedelta, timezone
+
+# the app's routes, hooks and CLI commands, registered on every app created by create_app
+bp = Blueprint("tasks", __name__, cli_group=None)
 
 csrf = CSRFProtect()
-csrf.init_app(app)
 
-# Establish a database connection
-database_url = "sqlite:///tasks.db"
-# Create an engine to connect to a SQLite database
-engine = create_engine(database_url, connect_args={"check_same_thread": False})
 
-# open a sql session
-SQL_Session = sessionmaker(bind=engine)
-sql_session = SQL_Session()
+def create_app(config=None):
+    """
+    App factory, e.g. gunicorn "app:create_app()" (`flask run` finds it too).
+    The configuration is read from the environment, then updated with config. The database engines, sessions,
+    caches, password hashing and background components are built on first use (see AppComponents), so creating the
+    app doesn't touch the database: the schema is bootstrapped with the first app context (the first request or CLI
+    command).
+    """
+    app = Flask(__name__)
+    configure(app)
+    app.config.update(config or {})
+
+    init_sessions(app)
+    csrf.init_app(app)
+
+    # the instrumentation's hooks and /metrics route are added now, the engines are instrumented as they are built
+    instrumentation = None
+    if app.config["SQL_INSTRUMENTATION"]:
+        instrumentation = SQLInstrumentation(
+            app, slow_query_ms=app.config["SLOW_QUERY_MS"], n_plus_one_threshold=app.config["N_PLUS_ONE_THRESHOLD"],
+            metrics_token=app.config["METRICS_TOKEN"])
+    components = app.extensions["tasks"] = AppComponents(app, instrumentation)
+    if instrumentation:
+        instrumentation.metrics.collectors += [
+            lambda: components.password_hasher.metrics_lines(),
+            lambda: cache_metrics_lines({"usernames": components.username_cache,
+                                         "fragments": components.fragment_cache})
+        ]
+
+    appcontext_pushed.connect(bootstrap_db_on_first_context, app)
+    app.teardown_appcontext(remove_sql_session)
+    app.register_blueprint(bp)
+    return app
+
+
+def configure(app):
+    """Set the app's configuration from the environment"""
+    # Configure session backend (signed cookies by default, see sessions.py for the server-side backends)
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SECRET_KEY"] = "some secret key"
+    app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "cookie")
+    app.config["SESSION_MEMORY_SIZE"] = int(os.environ.get("SESSION_MEMORY_SIZE", 10000))
+    app.config["SESSION_SQLITE_PATH"] = os.environ.get("SESSION_SQLITE_PATH", "sessions.db")
+    app.config["SESSION_SWEEP_INTERVAL"] = int(os.environ.get("SESSION_SWEEP_INTERVAL", 300))
+    app.config["SESSION_REDIS_URL"] = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379")
+
+    # Configure the database connection url (defaults to a local SQLite file) and startup schema bootstrap
+    app.config["DATABASE_URL"] = DATABASE_URL
+    app.config["DATABASE_BOOTSTRAP"] = os.environ.get("DATABASE_BOOTSTRAP", "1") == "1"
+
+    # Configure the database connection pool (pool size and overflow only apply to server databases)
+    app.config["DATABASE_POOL_SIZE"] = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+    app.config["DATABASE_MAX_OVERFLOW"] = int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+    app.config["DATABASE_POOL_RECYCLE"] = int(os.environ.get("DATABASE_POOL_RECYCLE", 1800))
+    app.config["SQLITE_BUSY_TIMEOUT"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+    # number of distinct statements whose compiled SQL is cached, see the sql_compiled_cache_total metric for its hit rate
+    app.config["DATABASE_QUERY_CACHE_SIZE"] = int(os.environ.get("DATABASE_QUERY_CACHE_SIZE", 500))
+
+    # Configure read replicas: read-only routes run their statements on one of DATABASE_REPLICA_URLS (comma separated,
+    # e.g. "sqlite:///file:tasks.db?mode=ro&uri=true" for read-only connections to the SQLite file), except for users
+    # who wrote in the last REPLICA_STICKY_SECONDS, so they see their own changes.
+    # SQLITE_BACKUP_REPLICA is a file refreshed with a copy of the SQLite database every SQLITE_BACKUP_REPLICA_INTERVAL
+    # seconds and used as a replica, to try out replication lag locally
+    app.config["DATABASE_REPLICA_URLS"] = [url for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url]
+    app.config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 30))
+    app.config["SQLITE_BACKUP_REPLICA"] = os.environ.get("SQLITE_BACKUP_REPLICA")
+    app.config["SQLITE_BACKUP_REPLICA_INTERVAL"] = int(os.environ.get("SQLITE_BACKUP_REPLICA_INTERVAL", 5))
+
+    # Configure the per-request SQL instrumentation: statements slower than SLOW_QUERY_MS are logged with their query
+    # plan, requests running a statement N_PLUS_ONE_THRESHOLD times are logged as N+1, aggregates are served at
+    # /metrics to clients sending "Authorization: Bearer <METRICS_TOKEN>" (not served if METRICS_TOKEN isn't set)
+    app.config["SQL_INSTRUMENTATION"] = os.environ.get("SQL_INSTRUMENTATION", "1") == "1"
+    app.config["SLOW_QUERY_MS"] = int(os.environ.get("SLOW_QUERY_MS", 100))
+    app.config["N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 10))
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+    # Configure password hashing, done on a pool of PASSWORD_HASH_WORKERS processes (in the request's thread if 0),
+    # hashes made with other parameters are replaced on login
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_SALT_LENGTH"] = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", min(os.cpu_count() or 1, 4)))
+
+    # Configure the id <-> username cache, USERNAME_CACHE_PATH is an optional SQLite file shared by the workers of a node
+    app.config["USERNAME_CACHE_SIZE"] = int(os.environ.get("USERNAME_CACHE_SIZE", 10000))
+    app.config["USERNAME_CACHE_TTL"] = int(os.environ.get("USERNAME_CACHE_TTL", 3600))
+    app.config["USERNAME_CACHE_PATH"] = os.environ.get("USERNAME_CACHE_PATH")
+
+    # Configure the cache of rendered task table rows and task info blocks, FRAGMENT_CACHE_PATH is an optional SQLite
+    # file shared by the workers of a node
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.environ.get("FRAGMENT_CACHE_SIZE", 5000))
+    app.config["FRAGMENT_CACHE_TTL"] = int(os.environ.get("FRAGMENT_CACHE_TTL", 3600))
+    app.config["FRAGMENT_CACHE_PATH"] = os.environ.get("FRAGMENT_CACHE_PATH")
+
+    # Configure username autocompletion, users registered on other workers show up after at most AUTOCOMPLETE_REFRESH
+    # seconds
+    app.config["AUTOCOMPLETE_LIMIT"] = int(os.environ.get("AUTOCOMPLETE_LIMIT", 10))
+    app.config["AUTOCOMPLETE_REFRESH"] = int(os.environ.get("AUTOCOMPLETE_REFRESH", 5))
+
+    # Configure notification fetching and streaming
+    app.config["NOTIFICATIONS_LIMIT"] = int(os.environ.get("NOTIFICATIONS_LIMIT", 20))
+    app.config["NOTIFICATIONS_HEARTBEAT"] = int(os.environ.get("NOTIFICATIONS_HEARTBEAT", 15))
+    # notifications are written in the background in batches, or in the same transaction as the change that caused them
+    # if 0
+    app.config["NOTIFICATIONS_ASYNC"] = os.environ.get("NOTIFICATIONS_ASYNC", "1") == "1"
+    app.config["NOTIFICATIONS_BATCH_SIZE"] = int(os.environ.get("NOTIFICATIONS_BATCH_SIZE", 500))
+    # notifications older than NOTIFICATIONS_RETENTION_DAYS are moved to the archive by `flask archive-notifications`,
+    # NOTIFICATIONS_ARCHIVE_BATCH_SIZE at a time
+    app.config["NOTIFICATIONS_RETENTION_DAYS"] = int(os.environ.get("NOTIFICATIONS_RETENTION_DAYS", 90))
+    app.config["NOTIFICATIONS_ARCHIVE_BATCH_SIZE"] = int(os.environ.get("NOTIFICATIONS_ARCHIVE_BATCH_SIZE", 1000))
+
+    # number of rows imported per transaction and exported per query by the bulk task import/export
+    app.config["BULK_CHUNK_SIZE"] = int(os.environ.get("BULK_CHUNK_SIZE", 1000))
+
+    # Configure due date reminders: every REMINDERS_INTERVAL seconds (never if 0) the assignees of tasks that became
+    # overdue are notified, REMINDERS_BATCH_SIZE tasks per transaction
+    app.config["REMINDERS_INTERVAL"] = int(os.environ.get("REMINDERS_INTERVAL", 300))
+    app.config["REMINDERS_BATCH_SIZE"] = int(os.environ.get("REMINDERS_BATCH_SIZE", 500))
+
+    # Configure HTTP caching: versioned static files are cached for STATIC_MAX_AGE seconds and username suggestions for
+    # a minute, notifications are revalidated with an ETag on every request since marking them read changes them
+    app.config["STATIC_MAX_AGE"] = int(os.environ.get("STATIC_MAX_AGE", 31536000))
+    app.config["USERS_MAX_AGE"] = int(os.environ.get("USERS_MAX_AGE", 60))
+    # number of comments shown on a task page and loaded at once
+    app.config["COMMENTS_PAGE_SIZE"] = int(os.environ.get("COMMENTS_PAGE_SIZE", 20))
+    # cached task pages are revalidated at least this often so their CSRF tokens (valid for an hour) stay usable
+    app.config["TASK_ETAG_INTERVAL"] = int(os.environ.get("TASK_ETAG_INTERVAL", 1800))
+
+
+def component(build):
+    """Decorate an AppComponents method building a component, so it's built once, on first use"""
+    name = build.__name__
+
+    @wraps(build)
+    def get(self):
+        if name not in self.built:
+            with self.lock:
+                if name not in self.built:
+                    self.built[name] = build(self)
+        return self.built[name]
+    return property(get)
+
+
+class AppComponents:
+    """
+    The database engines and sessions, caches, password hashing and background components of an app, at
+    app.extensions["tasks"] (see get_components). Each is built from the app's configuration when it's first used,
+    and the background threads and hashing processes are started by the first request that needs them, so creating
+    the app stays cheap.
+    """
+
+    def __init__(self, app, instrumentation=None):
+        self.app = app
+        self.config = app.config
+        self.instrumentation = instrumentation
+        self.built = {}
+        # components are built from others, e.g. the sessions from the engines
+        self.lock = threading.RLock()
+        self.bootstrapped = False
+
+    def bootstrap_db(self):
+        """
+        Create the tables and look-up rows if they are missing (if DATABASE_BOOTSTRAP), once.
+        Runs with the app's first app context rather than when it's created, scripts writing to the database directly
+        call it first.
+        """
+        with self.lock:
+            if not self.bootstrapped and self.config["DATABASE_BOOTSTRAP"]:
+                create_db(self.engine)
+            self.bootstrapped = True
+
+    def create_engine(self, url):
+        """Returns an engine with a connection pool shared by all worker threads, instrumented if enabled"""
+        engine = create_db_engine(
+            url,
+            pool_size=self.config["DATABASE_POOL_SIZE"],
+            max_overflow=self.config["DATABASE_MAX_OVERFLOW"],
+            pool_recycle=self.config["DATABASE_POOL_RECYCLE"],
+            sqlite_busy_timeout=self.config["SQLITE_BUSY_TIMEOUT"],
+            query_cache_size=self.config["DATABASE_QUERY_CACHE_SIZE"]
+        )
+        if self.instrumentation:
+            self.instrumentation.instrument(engine)
+        return engine
+
+    @component
+    def engine(self):
+        return self.create_engine(self.config["DATABASE_URL"])
+
+    @component
+    def backup_replica(self):
+        if not self.config["SQLITE_BACKUP_REPLICA"]:
+            return None
+        return SQLiteBackupReplica(
+            self.engine.url.database, self.config["SQLITE_BACKUP_REPLICA"], self.config["SQLITE_BACKUP_REPLICA_INTERVAL"])
+
+    @component
+    def replica_engines(self):
+        urls = list(self.config["DATABASE_REPLICA_URLS"])
+        if self.backup_replica:
+            urls.append(f"sqlite:///{self.config['SQLITE_BACKUP_REPLICA']}")
+        return [self.create_engine(url) for url in urls]
+
+    @component
+    def SQL_Session(self):
+        # the session event listeners below find the app's components in the session's info
+        return sessionmaker(class_=RoutingSession, bind=self.engine, replicas=self.replica_engines,
+                            info={"components": self})
+
+    @component
+    def sql_session(self):
+        # sql sessions are scoped to the current thread, so every request gets its own session
+        return scoped_session(self.SQL_Session)
+
+    @component
+    def password_hasher(self):
+        password_hasher = PasswordHasher(
+            self.config["PASSWORD_HASH_METHOD"], self.config["PASSWORD_SALT_LENGTH"],
+            self.config["PASSWORD_HASH_WORKERS"])
+        atexit.register(password_hasher.shutdown)
+        return password_hasher
+
+    @component
+    def username_cache(self):
+        # usernames can't change and unknown usernames aren't cached, so entries only have to be added on register
+        path = self.config["USERNAME_CACHE_PATH"]
+        return LRUCache(max_size=self.config["USERNAME_CACHE_SIZE"], ttl=self.config["USERNAME_CACHE_TTL"],
+                        store=SQLiteStore(path, table="usernames") if path else None)
+
+    @component
+    def fragment_cache(self):
+        # fragments are keyed by the task's version, which every update increments, so a changed task's old fragments
+        # are never looked up again and age out of the cache
+        path = self.config["FRAGMENT_CACHE_PATH"]
+        return LRUCache(max_size=self.config["FRAGMENT_CACHE_SIZE"], ttl=self.config["FRAGMENT_CACHE_TTL"],
+                        store=SQLiteStore(path, table="fragments") if path else None)
+
+    @component
+    def username_index(self):
+        return UsernameIndex(
+            lambda after_id: self.sql_session.query(User.id, User.username)
+            .filter(User.id > after_id).order_by(User.id).all(),
+            refresh_interval=self.config["AUTOCOMPLETE_REFRESH"]
+        )
+
+    @component
+    def notification_broker(self):
+        # new notifications are pushed to the notification streams open on this worker
+        return NotificationBroker()
+
+    @component
+    def notification_writer(self):
+        notification_writer = NotificationWriter(
+            self.SQL_Session, self.notification_broker, batch_size=self.config["NOTIFICATIONS_BATCH_SIZE"])
+        # write the queued notifications before exiting
+        atexit.register(notification_writer.flush)
+        return notification_writer
+
+    @component
+    def reminder_scheduler(self):
+        return ReminderScheduler(self.SQL_Session, self.publish_notifications, self.config["REMINDERS_INTERVAL"],
+                                 self.config["REMINDERS_BATCH_SIZE"])
+
+    def publish_notifications(self, published):
+        """Push written (user id, notification dict) notifications to the users' open notification streams"""
+        for user_id, notification in published:
+            self.notification_broker.publish(user_id, notification)
+
+
+def get_components(app=None):
+    """Returns the components of an app (the current app by default)"""
+    return (app or current_app).extensions["tasks"]
+
+
+def bootstrap_db_on_first_context(sender, **extra):
+    get_components(sender).bootstrap_db()
+
+
+# the current app's components used by the routes
+sql_session = LocalProxy(lambda: get_components().sql_session)
+password_hasher = LocalProxy(lambda: get_components().password_hasher)
+username_cache = LocalProxy(lambda: get_components().username_cache)
+fragment_cache = LocalProxy(lambda: get_components().fragment_cache)
+username_index = LocalProxy(lambda: get_components().username_index)
+
+
+# keyset pagination sort keys (column, descending) for each task sort order, the task id breaks ties
+# ids increase with creation time, so the newest tasks are the ones with the highest ids
+TASK_SORT_KEYS = {
+    "due_date": [(Task.due_date, False), (Task.id, False)],
+    "newest": [(Task.id, True)]
+}
+
+# The hot statements are built once with bound parameters, so requests reuse them and their cached compiled form
+# instead of building and hashing a new query each time
+TASK_BY_ID_STATEMENT = select(Task).where(Task.id == bindparam("id"))
+
+# dashboard pages of the unclosed tasks assigned to (or by) a user by (is_assigner, sort): (first page, next pages)
+USER_TASKS_STATEMENTS = {
+    (is_assigner, sort): keyset_statements(
+        select(Task).where(Task.status_id != STATUSES.index("Closed"),
+                           (Task.assigner_id if is_assigner else Task.assignee_id) == bindparam("user_id")),
+        sort_keys)
+    for is_assigner in (False, True) for sort, sort_keys in TASK_SORT_KEYS.items()
+}
+
+# pages of a task's comments keyset paginated over (timestamp, id): the newest, and the ones before or after a comment
+_reference_comment = tuple_(
+    select(Comment.timestamp).where(Comment.id == bindparam("reference_id")).scalar_subquery(), bindparam("reference_id"))
+_task_comments = select(Comment).where(Comment.task_id == bindparam("task_id"))
+COMMENTS_STATEMENTS = {
+    "newest": _task_comments.order_by(desc(Comment.timestamp), desc(Comment.id)).limit(bindparam("limit")),
+    "before": (_task_comments
+               .where(tuple_(Comment.timestamp, Comment.id) < _reference_comment)
+               .order_by(desc(Comment.timestamp), desc(Comment.id))
+               .limit(bindparam("limit"))),
+    "after": (_task_comments
+              .where(tuple_(Comment.timestamp, Comment.id) > _reference_comment)
+              .order_by(Comment.timestamp, Comment.id)
+              .limit(bindparam("limit")))
+}
 
 
 def login_required(f):
@@ -45,28 +373,212 @@ def login_required(f):
     return decorated_function
 
 
-@app.after_request
+def read_only(f):
+    """Decorate routes that don't write, so their statements can run on a read replica"""
+    f.read_only = True
+    return f
+
+
+@bp.before_app_request
+def route_reads_to_replica():
+    """Run the statements of read-only routes on a replica unless the user wrote recently"""
+    components = get_components()
+    if not components.replica_engines:
+        return
+    if components.backup_replica:
+        components.backup_replica.start()
+
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, "read_only", False) and session.get("read_primary_until", 0) < time.time():
+        sql_session.info["use_replica"] = True
+
+
+@bp.before_app_request
+def start_reminder_scheduler():
+    """Start the due date reminders in this worker process"""
+    if current_app.config["REMINDERS_INTERVAL"]:
+        get_components().reminder_scheduler.start()
+
+
+def remove_sql_session(exception=None):
+    """Roll back the request's sql session on error and return its connection to the pool"""
+    if "sql_session" not in get_components().built:
+        return
+    if exception:
+        sql_session.rollback()
+    sql_session.remove()
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def write_notifications(sql_session):
+    """Write the notifications added by notify() in the committing transaction unless they are written in the background"""
+    components = sql_session.info["components"]
+    if components.config["NOTIFICATIONS_ASYNC"] or not (notifications := sql_session.info.pop("notifications", None)):
+        return
+    sql_session.info["published_notifications"] = insert_notifications(sql_session, notifications)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def publish_notifications(sql_session):
+    """Hand the notifications added by notify() to the background writer or publish the ones written by the commit"""
+    components = sql_session.info["components"]
+    if notifications := sql_session.info.pop("notifications", None):
+        components.notification_writer.enqueue(notifications)
+
+    components.publish_notifications(sql_session.info.pop("published_notifications", []))
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def read_own_writes(sql_session):
+    """Read from the primary for REPLICA_STICKY_SECONDS after a user's commit that wrote, so they see their changes"""
+    components = sql_session.info["components"]
+    if sql_session.info.pop("wrote", False) and components.replica_engines and has_request_context():
+        session["read_primary_until"] = time.time() + components.config["REPLICA_STICKY_SECONDS"]
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def discard_notifications(sql_session, previous_transaction):
+    """Forget the notifications of a rolled back change"""
+    sql_session.info.pop("notifications", None)
+    sql_session.info.pop("published_notifications", None)
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def increment_task_versions(sql_session, flush_context, instances):
+    """Increment the version of the updated tasks in the same statement, which invalidates their cached fragments"""
+    for task in sql_session.dirty:
+        if isinstance(task, Task) and sql_session.is_modified(task):
+            task.version = Task.version + 1
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def update_task_counts(sql_session, flush_context):
+    """Keep the dashboard's task counts in step with the flushed tasks, in the same transaction"""
+    if deltas := task_count_deltas(sql_session):
+        apply_task_count_deltas(sql_session.connection(), deltas)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def log_task_events(sql_session, flush_context):
+    """Append the flushed task changes to the task events log, in the same transaction"""
+    actor_id = session.get("user_id") if has_request_context() else None
+    if events := task_events(sql_session, actor_id):
+        sql_session.connection().execute(insert(TaskEvent), events)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def keep_renamed_task_notification_titles(sql_session, flush_context):
+    """Keep the titles of renamed tasks' past notifications, in the same transaction"""
+    keep_notification_titles(sql_session)
+
+
+@bp.app_errorhandler(InvalidCursor)
+def invalid_cursor(error):
+    """Start from the first page if a next page token is invalid"""
+    flash("Invalid page!")
+    return redirect(request.path)
+
+
+@bp.after_app_request
 def after_request(response):
-    """Ensure responses aren't cached"""
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
+    """
+    Cache versioned static files for long and ensure other responses aren't cached,
+    unless the route set its own caching headers
+    """
+    if request.endpoint == "static":
+        # the version changes with the file's content
+        if request.args.get("v"):
+            response.headers["Cache-Control"] = f"public, max-age={current_app.config['STATIC_MAX_AGE']}, immutable"
+        return response
+
+    if "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
     
     return response
 
 
-@app.route("/")
+@bp.app_context_processor
+def utility_processor():
+    """Make static_url available in templates"""
+    return {"static_url": static_url}
+
+
+@bp.app_template_global()
+def render_task_row(task_join_lookup, show_assignee=True, show_assigner=True):
+    """Returns a task's rendered tasks table row, cached until the task is updated"""
+    task = task_join_lookup[0]
+    return Markup(fragment_cache.get_or_set(
+        f"task-row:{task.id}:{task.version}:{int(show_assignee)}{int(show_assigner)}",
+        lambda: current_app.jinja_env.get_template("task_row.html").render(
+            task_join_lookup=task_join_lookup, show_assignee=show_assignee, show_assigner=show_assigner)
+    ))
+
+
+@bp.app_template_global()
+def render_task_info(task_join_lookup):
+    """Returns a task's rendered info block, cached until the task is updated"""
+    task = task_join_lookup[0]
+    can_edit = session.get("user_id") in (task.assignee_id, task.assigner_id)
+    return Markup(fragment_cache.get_or_set(
+        f"task-info:{task.id}:{task.version}:{int(can_edit)}",
+        lambda: current_app.jinja_env.get_template("task_info.html").render(task_join_lookup=task_join_lookup, can_edit=can_edit)
+    ))
+
+
+def static_url(filename):
+    """Returns the url of a static file with a version derived from its content"""
+    return url_for("static", filename=filename, v=static_file_version(filename))
+
+
+@lru_cache(maxsize=None)
+def static_file_version(filename):
+    """Returns a short hash of a static file's content"""
+    with open(os.path.join(current_app.static_folder, filename), "rb") as file:
+        return hashlib.md5(file.read()).hexdigest()[:10]
+
+
+@bp.route("/")
 @login_required
+@read_only
 def index():
     """
     Task dashboard 
     contains two tables - one of tasks assigned to user and one of tasks assigned by user
+    each table is paginated separately
     """
+    sort = request.args.get("sort")
+    if sort not in TASK_SORT_KEYS:
+        sort = TASK_SORTS[0][0]
+    page_size = get_page_size(request.args.get("page_size"))
+    assignee_cursor = request.args.get("assignee_cursor")
+    assigner_cursor = request.args.get("assigner_cursor")
+
+    user_tasks_join_lookup, assignee_next_cursor = get_user_tasks_join_lookup(
+        sort=sort, page_size=page_size, cursor=assignee_cursor)
+    assigned_by_user_tasks_join_lookup, assigner_next_cursor = get_user_tasks_join_lookup(
+        is_assigner=True, sort=sort, page_size=page_size, cursor=assigner_cursor)
 
-    return render_template("index.html", user_tasks_join_lookup=get_user_tasks_join_lookup(), assigned_by_user_tasks_join_lookup=get_user_tasks_join_lookup(is_assigner=True))
+    return render_template(
+        "index.html",
+        task_counts=get_task_counts(sql_session, session["user_id"]),
+        overdue_count=get_overdue_count(sql_session, session["user_id"], date.today()),
+        priorities=PRIORITY_LEVELS,
+        statuses=STATUSES,
+        user_tasks_join_lookup=user_tasks_join_lookup,
+        assigned_by_user_tasks_join_lookup=assigned_by_user_tasks_join_lookup,
+        assignee_next_page_url=assignee_next_cursor and url_for(
+            ".index", sort=sort, page_size=page_size, assignee_cursor=assignee_next_cursor, assigner_cursor=assigner_cursor),
+        assigner_next_page_url=assigner_next_cursor and url_for(
+            ".index", sort=sort, page_size=page_size, assignee_cursor=assignee_cursor, assigner_cursor=assigner_next_cursor),
+        sort=sort,
+        sorts=TASK_SORTS,
+        page_size=page_size
+    )
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     """Log user in"""
 
@@ -83,10 +595,16 @@ def login():
         user = get_user(username=login_form.username.data)
 
         # Ensure username exists and password is correct
-        if user and check_password_hash(user.hash, login_form.password.data):
+        if user and password_hasher.check(user.hash, login_form.password.data):
+            # upgrade the hash if the hashing parameters changed since it was made
+            if password_hasher.needs_rehash(user.hash):
+                user.hash = password_hasher.hash(login_form.password.data)
+                sql_session.commit()
+
             # Remember which user has logged in
             session["user_id"] = user.id
             session["username"] = user.username
+            regenerate_session(current_app, session)
             # Redirect user to home page
             return redirect("/")
         
@@ -99,7 +617,7 @@ def login():
     return render_template("user_form.html", title="Log in", action="/login", user_form=login_form)
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     """Log user out by clearing session"""
 
@@ -110,7 +628,7 @@ def logout():
     return redirect("/login")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     """Register user"""
 
@@ -127,13 +645,17 @@ def register():
         # Check if username is already taken
         if not get_user(username=username):
             # Insert a new user into the database
-            new_user = User(username=username, hash=generate_password_hash(register_form.password.data))
+            new_user = User(username=username, hash=password_hasher.hash(register_form.password.data))
             sql_session.add(new_user)
             sql_session.commit()
 
+            cache_username(new_user.id, new_user.username)
+            username_index.add(new_user.id, new_user.username)
+
             # Remember which user has logged in
             session["user_id"] = new_user.id
             session["username"] = new_user.username
+            regenerate_session(current_app, session)
 
             flash("Registered!")
 
@@ -149,7 +671,7 @@ def register():
     return render_template("user_form.html", title="Register", action="/register", user_form=register_form)
 
 
-@app.route("/change_password", methods=["GET", "POST"])
+@bp.route("/change_password", methods=["GET", "POST"])
 @login_required
 def change_password():
     """Change password stored in the db as a hash value"""
@@ -162,9 +684,9 @@ def change_password():
         user = get_user(session["user_id"])
 
         # Ensure user entered correct old password
-        if check_password_hash(user.hash, change_password_form.old_password.data):
+        if password_hasher.check(user.hash, change_password_form.old_password.data):
             # change the password
-            user.hash = generate_password_hash(change_password_form.password.data)
+            user.hash = password_hasher.hash(change_password_form.password.data)
             sql_session.commit()
 
             flash("Password changed!")
@@ -181,7 +703,7 @@ def change_password():
     return render_template("user_form.html", title="Change Password", action="/change_password", user_form=change_password_form)
 
 
-@app.route("/new_task", methods=["GET", "POST"])
+@bp.route("/new_task", methods=["GET", "POST"])
 @login_required
 def new_task():
     """Create a new task"""
@@ -195,13 +717,15 @@ def new_task():
         new_task = Task()
         if form_to_task(task_form, new_task):
             sql_session.add(new_task)
-            sql_session.commit()
-
-            flash("Created task!")
+            # get the new task's id
+            sql_session.flush()
 
             # send a notification to the assignee
             if session["user_id"] != new_task.assignee_id:
-                notify(new_task.assignee_id, new_task.id, f'{session["username"]} assigned you task "{new_task.title}"')
+                notify(new_task.assignee_id, new_task.id, new_task.title, "assigned", session["user_id"])
+
+            sql_session.commit()
+            flash("Created task!")
 
             return redirect(f"show_task?id={new_task.id}")
 
@@ -209,26 +733,44 @@ def new_task():
     return render_template("new_task.html", form=task_form)
     
     
-@app.route("/show_task")
+@bp.route("/show_task")
 @login_required
+@read_only
 def show_task():
-    """Show more information about a specific task, edit task button and comments on the task."""
+    """
+    Show more information about a specific task, edit task button and comments on the task.
+    Responds 304 Not Modified without rendering if the task and its comments didn't change since the client's copy.
+    """
 
     task_id = request.args.get("id")
     
-    # get a specific task joined with the look-up tables
-    tasks_join_lookup_query = get_tasks_join_lookup_query()
-    task_join_lookup = tasks_join_lookup_query.filter(Task.id == task_id).first()
+    if not (task := get_task(task_id)):
+        flash("Task not found!")
+        return redirect("/")
 
-    return render_template(
-        "show_task.html", 
-        task_join_lookup=task_join_lookup,
-        comments=get_comments(task_id),
-        comment_form=CommentForm(task_id=task_id)
-    )
+    etag, last_modified = get_task_etag(task)
 
+    # pending flashed messages have to be rendered
+    if request.if_none_match.contains(etag) and not session.get("_flashes"):
+        response = Response(status=304)
+    else:
+        # render the newest comments, older ones are loaded on demand
+        comments, has_older_comments = get_comments(task_id)
+        response = make_response(render_template(
+            "show_task.html", 
+            task_join_lookup=join_lookup([task])[0],
+            comments=comments,
+            has_older_comments=has_older_comments,
+            comment_form=CommentForm(task_id=task_id)
+        ))
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
-@app.route("/edit_task", methods=["GET", "POST"])
+
+@bp.route("/edit_task", methods=["GET", "POST"])
 @login_required
 def edit_task():
     """Edit a specific task"""
@@ -248,12 +790,12 @@ def edit_task():
     # User reached via POST. The assigner user can edit everything about a task
     if is_assigner and edit_task_form.validate_on_submit():
         if form_to_task(edit_task_form, task):
-            sql_session.commit()
-            flash("Edited task!")
-
             # send a notification to the assignee that the task was editted
             if session["user_id"] != task.assignee_id:
-                notify(task.assignee_id, task.id, f'{session["username"]} updated task "{task.title}"')
+                notify(task.assignee_id, task.id, task.title, "updated", session["user_id"])
+
+            sql_session.commit()
+            flash("Edited task!")
         
             return redirect(f"show_task?id={task_id}")
     
@@ -264,23 +806,28 @@ def edit_task():
             flash("You can't close this task!")
         else:
             task.status_id = status_id
-            sql_session.commit()
-            flash("Edited task status!")
 
             # send a notification to the assigner that the task status was editted
-            notify(task.assigner_id, task.id, f'{session["username"]} updated task "{task.title}" status')
+            notify(task.assigner_id, task.id, task.title, "status_updated", session["user_id"])
+
+            sql_session.commit()
+            flash("Edited task status!")
 
             return redirect(f"show_task?id={task_id}")
 
     # User reached route via GET (as by clicking a link or via redirect) or form validation failed
-    return render_template("edit_task.html", form=EditTaskForm(obj=task, assignee=get_user(task.assignee_id).username), is_assigner=is_assigner)
+    return render_template("edit_task.html", form=EditTaskForm(obj=task, assignee=get_username(task.assignee_id)), is_assigner=is_assigner)
 
 
-@app.route("/add_comment", methods=["POST"])
+@bp.route("/add_comment", methods=["POST"])
 @login_required
 def add_comment():
-    """ Add a comment to a task"""
+    """
+    Add a comment to a task
+    JSON requests (as sent by the task page's script) get the new comment back instead of a redirect
+    """
     comment_form = CommentForm()
+    wants_json = request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
 
     task_id = comment_form.task_id.data
 
@@ -289,59 +836,269 @@ def add_comment():
         # add a new comment associated with a specific task
         new_comment = Comment(text=comment_form.text.data, user_id=session["user_id"], task_id=task_id)
         sql_session.add(new_comment)
-        sql_session.commit()
 
         # send a notification to the assigner and the assignee if they didn't write the comment
         task = get_task(task_id)
         if session["user_id"] != task.assignee_id:
-            notify(task.assignee_id, task.id, f'{session["username"]} commented on task "{task.title}"')
+            notify(task.assignee_id, task.id, task.title, "commented", session["user_id"])
         if session["user_id"] != task.assigner_id:
-            notify(task.assigner_id, task.id, f'{session["username"]} commented on task "{task.title}"')
+            notify(task.assigner_id, task.id, task.title, "commented", session["user_id"])
+
+        sql_session.commit()
+
+        if wants_json:
+            return jsonify(comment_to_dict(new_comment, session["username"]))
+
+    elif wants_json:
+        return jsonify({"error": "Invalid comment"}), 400
 
     return redirect(f"show_task?id={task_id}")
 
 
-@app.route("/get_users")
+@bp.route("/get_comments")
+@login_required
+@read_only
+def get_task_comments():
+    """
+    Returns a page of a task's comments, oldest first: the ones before the comment with the "before_id" parameter,
+    the ones after the comment with the "after_id" parameter or the newest ones
+    """
+    task_id = request.args.get("task_id", type=int)
+    if not task_id:
+        return jsonify({"error": 'Missing "task_id" parameter'}), 400
+
+    comments, has_more = get_comments(
+        task_id, before_id=request.args.get("before_id", type=int), after_id=request.args.get("after_id", type=int))
+
+    return jsonify({
+        "comments": [comment_to_dict(comment, username) for comment, username in comments],
+        "has_more": has_more
+    })
+
+
+@bp.route("/get_users")
 @login_required
 def get_users():
-    """Returns a list of all usernames that contain the provided "name"."""
-    name = request.args.get("name")
+    """Returns the first usernames in alphabetical order that start with the provided "name"."""
+    name = request.args.get("name", "").strip()
     
     if not name:
         return jsonify({"error": 'Missing "name" parameter'}), 400
     
-    if users := sql_session.query(User).filter(User.username.ilike(f"%{name}%")).all():
-        return jsonify([user.username for user in users])
+    if usernames := username_index.complete(name, limit=current_app.config["AUTOCOMPLETE_LIMIT"]):
+        response = jsonify(usernames)
+        response.headers["Cache-Control"] = f"private, max-age={current_app.config['USERS_MAX_AGE']}"
+        return response
     else:
         return jsonify({"error": "No users found"}), 500
 
 
-@app.route("/get_notifications")
+@bp.route("/get_notifications")
 @login_required
+@read_only
 def get_notifications():
-    """Returns all notifications for the current user"""
-    
-    if notifications := sql_session.query(Notification).filter(Notification.user_id == session["user_id"]).order_by(desc(Notification.timestamp)).all():
-        return jsonify([{"text": notification.text, "task_id": notification.task_id, "timestamp": notification.timestamp} for notification in notifications])
-    else:
-        return jsonify({"error": "No notifications found"}), 500
+    """
+    Returns the current user's newest notifications, newest first.
+    Only notifications with an id greater than the "after_id" parameter are returned, so clients can fetch
+    just the notifications they don't have, and only unread ones if the "unread" parameter is 1.
+    """
+    query = get_notifications_query(session["user_id"], request.args.get("after_id", 0, type=int))
+
+    if request.args.get("unread") == "1":
+        query = query.filter(Notification.is_read == False)
+
+    # between 1 and 100, SQLite reads a negative LIMIT as no limit
+    limit = max(1, min(request.args.get("limit", current_app.config["NOTIFICATIONS_LIMIT"], type=int), 100))
+    response = jsonify(notifications_to_dicts(query.limit(limit).all()))
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+@bp.route("/read_notifications", methods=["POST"])
+@login_required
+def read_notifications():
+    """Mark the current user's notifications up to the "up_to_id" parameter (or all of them) as read"""
+    query = sql_session.query(Notification).filter(Notification.user_id == session["user_id"], Notification.is_read == False)
+
+    if up_to_id := request.form.get("up_to_id", type=int):
+        query = query.filter(Notification.id <= up_to_id)
+
+    query.update({Notification.is_read: True}, synchronize_session=False)
+    sql_session.commit()
+
+    return jsonify({"success": True})
+
+
+@bp.route("/notifications/stream")
+@login_required
+def stream_notifications():
+    """
+    Server-Sent Events stream of the current user's new notifications.
+    Notifications missed since the "Last-Event-ID" header (or the "after_id" parameter) are sent first.
+    """
+    user_id = session["user_id"]
+    after_id = request.headers.get("Last-Event-ID", type=int) or request.args.get("after_id", 0, type=int)
+
+    # the stream outlives the request's context
+    app = current_app._get_current_object()
+    broker = get_components().notification_broker
+    # subscribe before reading the missed notifications so none are lost in between
+    subscriber = broker.subscribe(user_id)
+    missed_notifications = notifications_to_dicts(
+        get_notifications_query(user_id, after_id).limit(app.config["NOTIFICATIONS_LIMIT"]).all())
+
+    def events():
+        last_id = after_id
+        for notification in reversed(missed_notifications):
+            last_id = notification["id"]
+            yield f"id: {last_id}\ndata: {app.json.dumps(notification)}\n\n"
+
+        for notification in broker.listen(user_id, subscriber, app.config["NOTIFICATIONS_HEARTBEAT"]):
+            if notification is None:
+                # keep the connection alive and find out if the client went away
+                yield ": heartbeat\n\n"
+            elif notification["id"] > last_id:
+                last_id = notification["id"]
+                yield f"id: {last_id}\ndata: {app.json.dumps(notification)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"X-Accel-Buffering": "no"})
     
 
-@app.route("/search_task", methods=["GET", "POST"])
+@bp.route("/search_task", methods=["GET", "POST"])
 @login_required
+@read_only
 def search_task():
-    """Search and filter tasks"""
+    """Search and filter tasks, the next page token of the results is passed as a "cursor" url parameter"""
     search_task_form = SearchTaskForm()
     tasks_join_lookup = []
+    next_cursor = None
 
     # User reached route via POST (as by submitting a form via POST) validate the form fields
     if search_task_form.validate_on_submit():
-        # get all tasks that pass the filters provided in the form
-        tasks_join_lookup_query = get_tasks_join_lookup_query()
-        tasks_join_lookup = filter_tasks_query(tasks_join_lookup_query, search_task_form).all()
-        flash(f"{len(tasks_join_lookup)} tasks found!")
+        # get a page of the tasks that pass the filters provided in the form
+        tasks_query = filter_tasks_query(get_tasks_query(), search_task_form)
+
+        sort = search_task_form.sort.data
+        sort_keys = TASK_SORT_KEYS.get(sort)
+        # rank text search matches best first, falling back to due date if there is nothing to rank
+        if sort == "relevance" and search_task_form.text.data:
+            if (rank := text_search_rank(tasks_query, search_task_form.text.data)) is not None:
+                sort_keys = [(rank, False), (Task.id, False)]
+        if sort_keys is None:
+            sort, sort_keys = "due_date", TASK_SORT_KEYS["due_date"]
+
+        tasks, next_cursor = paginate(
+            tasks_query, sort, sort_keys, get_page_size(search_task_form.page_size.data), request.args.get("cursor"))
+        tasks_join_lookup = join_lookup(tasks)
+        if not request.args.get("cursor"):
+            flash(f"{len(tasks_join_lookup)}{'+' if next_cursor else ''} tasks found!")
+
+    return render_template("search_task.html", form=search_task_form, tasks_join_lookup=tasks_join_lookup, next_cursor=next_cursor)
+
+
+@bp.route("/import_tasks", methods=["POST"])
+@login_required
+def import_tasks_route():
+    """
+    Create the tasks of a CSV or JSON lines request body, assigned by the user.
+    The format is the "format" url parameter or the body's content type (text/csv or application/jsonl).
+    The body is read and imported a chunk of rows at a time, responds with the number of imported tasks
+    and the line numbers of the skipped invalid rows.
+    """
+    if not (format := get_format(request.args.get("format"), request.content_type)):
+        return jsonify({"error": f"Unsupported format, use one of: {', '.join(FORMATS)}"}), 415
+
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    imported, errors = import_tasks(
+        sql_session, read_rows(lines, format), session["username"], notify, current_app.config["BULK_CHUNK_SIZE"])
+
+    return jsonify({"imported": imported, "errors": errors})
+
+
+@bp.route("/export_tasks")
+@login_required
+@read_only
+def export_tasks():
+    """Download the tasks assigned to and by the user as CSV or JSON lines (the "format" url parameter), streamed"""
+    format = get_format(request.args.get("format", "csv"))
+    if not format:
+        return jsonify({"error": f"Unsupported format, use one of: {', '.join(FORMATS)}"}), 415
+
+    return Response(
+        stream_with_context(write_rows(get_export_pages(session["user_id"]), format)),
+        mimetype=FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=tasks.{format}"}
+    )
+
+
+@bp.route("/task_events")
+@login_required
+@read_only
+def get_task_events_route():
+    """
+    Stream the changes of the tasks assigned to and by the user as JSON lines, in id order, starting after the
+    "since" url parameter (an event id), so consumers can sync incrementally from the last event they got
+    """
+    since = request.args.get("since", 0, type=int)
+    return Response(stream_with_context(write_task_events(since, session["user_id"])), mimetype=FORMATS["jsonl"])
+
+
+@bp.cli.command("task-events")
+@click.option("--since", type=int, default=0, help="Write the events after this event id.")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-")
+def task_events_command(since, output):
+    """Write the task events log as JSON lines"""
+    for text in write_task_events(since):
+        output.write(text)
+
+
+@bp.cli.command("send-reminders")
+def send_reminders_command():
+    """Notify the assignees of the tasks that became overdue since the last reminders (e.g. from cron)"""
+    click.echo(f"Sent {get_components().reminder_scheduler.send_reminders()} reminders")
+
+
+@bp.cli.command("import-tasks")
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+@click.option("--assigner", required=True, help="Username of the assigner of rows without an assigner column.")
+@click.option("--format", type=click.Choice(list(FORMATS)), help="Defaults to the file's extension.")
+def import_tasks_command(file, assigner, format):
+    """Create the tasks of a CSV or JSON lines FILE ("-" for stdin)"""
+    format = format or get_format(os.path.splitext(file.name)[1].lstrip("."))
+    if not format:
+        raise click.UsageError("Can't tell the file's format, pass --format")
+
+    imported, errors = import_tasks(
+        sql_session, read_rows(file, format), assigner, notify, current_app.config["BULK_CHUNK_SIZE"], allow_assigner=True)
+
+    for error in errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Imported {imported} tasks")
 
-    return render_template("search_task.html", form=search_task_form, tasks_join_lookup=tasks_join_lookup)
+
+@bp.cli.command("archive-notifications")
+@click.option("--days", type=int, help="Archive notifications older than this many days (defaults to NOTIFICATIONS_RETENTION_DAYS).")
+def archive_notifications_command(days):
+    """Move old notifications to the notification archive in bounded batches"""
+    days = current_app.config["NOTIFICATIONS_RETENTION_DAYS"] if days is None else days
+    before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    archived = archive_notifications(
+        get_components().SQL_Session, before, current_app.config["NOTIFICATIONS_ARCHIVE_BATCH_SIZE"])
+    click.echo(f"Archived {archived} notifications")
+
+
+@bp.cli.command("export-tasks")
+@click.option("--user", "username", required=True, help="Export the tasks assigned to and by this user.")
+@click.option("--format", type=click.Choice(list(FORMATS)), default="csv")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-")
+def export_tasks_command(username, format, output):
+    """Write a user's tasks as CSV or JSON lines"""
+    if (user_id := get_user_id(username)) is None:
+        raise click.BadParameter(f"No user named {username!r}", param_hint="--user")
+
+    for text in write_rows(get_export_pages(user_id), format):
+        output.write(text)
 
 
 def get_user(id=None, username=""):
@@ -351,99 +1108,231 @@ def get_user(id=None, username=""):
     return sql_session.query(User).filter_by(id=id).first()
 
 
+def get_user_id(username):
+    """Returns the id of the user with a username (None if there is no such user), cached"""
+    if (id := username_cache.get(f"username:{username}")) is not MISSING:
+        return id
+
+    if user := get_user(username=username):
+        cache_username(user.id, user.username)
+        return user.id
+    return None
+
+
+def get_username(id):
+    """Returns the username of a user id (None if there is no such user), cached"""
+    return get_usernames({id}).get(id)
+
+
+def get_usernames(ids):
+    """Returns a dict mapping user ids to usernames, users missing from the cache are fetched in one query"""
+    usernames = {}
+    missing_ids = set()
+    for id in ids:
+        if (username := username_cache.get(f"id:{id}")) is MISSING:
+            missing_ids.add(id)
+        else:
+            usernames[id] = username
+
+    if missing_ids:
+        for id, username in sql_session.query(User.id, User.username).filter(User.id.in_(missing_ids)):
+            cache_username(id, username)
+            usernames[id] = username
+
+    return usernames
+
+
+def cache_username(id, username):
+    """Add a user to the id <-> username cache"""
+    username_cache.set(f"id:{id}", username)
+    username_cache.set(f"username:{username}", id)
+
+
 def get_task(id):
     """Returns a sqlalchemy Task table obj by filtering id"""
-    return sql_session.query(Task).filter_by(id=id).first()
+    return sql_session.scalars(TASK_BY_ID_STATEMENT, {"id": id}).first()
     
 
 def form_to_task(form, task):
     """ Populate a sqlalchemy Task table obj using a Flask WTForm Task obj"""
     form.populate_obj(task)
     task.assigner_id = session["user_id"]
-    if assignee := get_user(username=form.assignee.data):
-        task.assignee_id = assignee.id
+    if assignee_id := get_user_id(form.assignee.data):
+        task.assignee_id = assignee_id
         return True
     else:
         flash("Invalid assignee!")
         return False
 
 
-def get_user_tasks_join_lookup(is_assigner=False):
-    """ Returns all unclosed tasks joined with look-up tables, where user is assignee (or assigner) """
-    query = get_tasks_join_lookup_query()
+def get_user_tasks_join_lookup(is_assigner=False, sort="due_date", page_size=None, cursor=None):
+    """
+    Returns a page of unclosed tasks joined with look-up tables, where user is assignee (or assigner),
+    and the next page token
+    """
+    tasks, next_cursor = paginate_statements(
+        sql_session, USER_TASKS_STATEMENTS[(is_assigner, sort)], sort, TASK_SORT_KEYS[sort],
+        page_size or get_page_size(None), cursor, {"user_id": session["user_id"]})
+    return join_lookup(tasks), next_cursor
 
-    query = query.filter(Status.id != STATUSES.index("Closed"))
 
-    if is_assigner:
-        query = query.filter(Task.assigner_id == session["user_id"])
-    else:
-        query = query.filter(Task.assignee_id == session["user_id"])
+def get_export_pages(user_id):
+    """
+    Yields pages of exported rows of the tasks assigned to and by a user, in id order.
+    Every page is a keyset paginated query of BULK_CHUNK_SIZE tasks, so only a page is held in memory.
+    """
+    query = get_tasks_query().filter((Task.assignee_id == user_id) | (Task.assigner_id == user_id))
+    sort_keys = [(Task.id, False)]
+    cursor = None
 
-    return query.all()
+    while True:
+        tasks, cursor = paginate(query, "id", sort_keys, current_app.config["BULK_CHUNK_SIZE"], cursor)
+        yield [task_to_row(*task_join_lookup) for task_join_lookup in join_lookup(tasks)]
+        if not cursor:
+            return
 
 
-def get_tasks_join_lookup_query():
-    """ Returns a query of all tasks joined with the look-up tables for users, statuses and priorities"""
-    UserAssignee = aliased(User)
-    UserAssigner = aliased(User)
+def write_task_events(since, user_id=None):
+    """Yields the JSON lines of the task events after since (of a user's tasks if given), BULK_CHUNK_SIZE at a time"""
+    while events := get_task_events(sql_session, since, current_app.config["BULK_CHUNK_SIZE"], user_id):
+        yield "".join(current_app.json.dumps(event_to_dict(event)) + "\n" for event in events)
+        since = events[-1].id
+        # don't keep the streamed events in the identity map
+        sql_session.expunge_all()
 
-    return (sql_session.query(Task, UserAssignee.username, UserAssigner.username, Priority.level, Status.status)
-            .join(UserAssignee, Task.assignee_id == UserAssignee.id)
-            .join(UserAssigner, Task.assigner_id == UserAssigner.id)
-            .join(Priority, Task.priority_id == Priority.id)
-            .join(Status, Task.status_id == Status.id)
-            )
 
+def get_tasks_query():
+    """ Returns a query of all tasks, use join_lookup to add the look-up values to the fetched tasks"""
+    return sql_session.query(Task)
 
-def filter_tasks_query(tasks_join_lookup_query, form):
+
+def join_lookup(tasks):
+    """
+    Returns (task, assignee username, assigner username, priority level, status) tuples for a list of tasks.
+    Priorities and statuses come from the in-process look-up lists and usernames from one batched query.
+    """
+    usernames = get_usernames({task.assignee_id for task in tasks} | {task.assigner_id for task in tasks})
+
+    return [(task, usernames.get(task.assignee_id), usernames.get(task.assigner_id),
+             PRIORITY_LEVELS[task.priority_id], STATUSES[task.status_id]) for task in tasks]
+
+
+def filter_tasks_query(tasks_query, form):
     """Filter sqlalchemy Tasks query using form fields as filters"""
     if text := form.text.data:
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(
-            or_(Task.title.ilike(f"%{text}%"), Task.description.ilike(f"%{text}%")))
+        tasks_query = filter_tasks_by_text(tasks_query, text)
 
     assignee = form.assignee.data
-    if user_assignee := get_user(username=assignee):
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(Task.assignee_id == user_assignee.id)
+    if assignee_id := get_user_id(assignee):
+        tasks_query = tasks_query.filter(Task.assignee_id == assignee_id)
     elif assignee:
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(False)
+        tasks_query = tasks_query.filter(False)
 
     assigner = form.assigner.data
-    if user_assigner := get_user(username=assigner):
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(Task.assigner_id == user_assigner.id)
+    if assigner_id := get_user_id(assigner):
+        tasks_query = tasks_query.filter(Task.assigner_id == assigner_id)
     elif assigner:
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(False)
+        tasks_query = tasks_query.filter(False)
 
     if due_date := form.due_date.data:
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(Task.due_date == due_date)
+        tasks_query = tasks_query.filter(Task.due_date == due_date)
+
+    tasks_query = filter_tasks_by_due_date(tasks_query, date.today(), form.due.data, form.due_from.data, form.due_to.data)
 
     priority_id = form.priority_id.data
     if priority_id != "Any":
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(Task.priority_id == int(priority_id))
+        tasks_query = tasks_query.filter(Task.priority_id == int(priority_id))
 
     status_id = form.status_id.data
     if status_id != "Any":
-        tasks_join_lookup_query = tasks_join_lookup_query.filter(Task.status_id == int(status_id))
+        tasks_query = tasks_query.filter(Task.status_id == int(status_id))
 
-    return tasks_join_lookup_query
+    return tasks_query
 
 
-def get_comments(task_id):
-    """ Returns all comments associated with a specific task."""
-    return (sql_session.query(Comment, User.username)
-            .join(User, Comment.user_id == User.id)
-            .filter(Comment.task_id == task_id)
-            .order_by(Comment.timestamp)
-            .all()
-            )
+def get_task_etag(task):
+    """
+    Returns the ETag and the last modification time of a task's page.
+    The ETag covers the task's values, its comments, the viewing user and the CSRF token, which changes on login,
+    and its validity period, so a cached page never posts an outdated token.
+    """
+    # the page's comment form carries the session's CSRF token, make sure the session has one before hashing it
+    generate_csrf()
+    last_comment_id, comments_count, last_comment_timestamp = (sql_session
+        .query(func.max(Comment.id), func.count(Comment.id), func.max(Comment.timestamp))
+        .filter(Comment.task_id == task.id)
+        .one())
 
+    version = (task.id, task.title, task.description, task.due_date, task.assignee_id, task.assigner_id,
+               task.priority_id, task.status_id, last_comment_id, comments_count, session["user_id"],
+               session["csrf_token"], int(time.time() // current_app.config["TASK_ETAG_INTERVAL"]))
+    etag = hashlib.md5(repr(version).encode()).hexdigest()
 
-def notify(user_id, task_id, text):
-    """Add a new notification to the db associated with a user and a task"""
+    last_modified = max(filter(None, (task.timestamp, task.updated_at, last_comment_timestamp)))
+    return etag, last_modified
 
-    new_notification = Notification(user_id=user_id, task_id=task_id, text=text)
-    sql_session.add(new_notification)
-    sql_session.commit()
 
+def get_comments(task_id, before_id=None, after_id=None):
+    """
+    Returns a page of (comment, username) of a task, oldest first, and whether there are more comments in the
+    direction of the page: the newest comments, the comments before the comment before_id or after the comment after_id.
+    Pages are keyset paginated over (timestamp, id), backed by the index on (task_id, timestamp).
+    """
+    limit = current_app.config["COMMENTS_PAGE_SIZE"]
+    page = "after" if after_id else "before" if before_id else "newest"
+
+    comments = sql_session.scalars(
+        COMMENTS_STATEMENTS[page], {"task_id": task_id, "reference_id": after_id or before_id, "limit": limit + 1}).all()
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+    if not after_id:
+        comments.reverse()
+
+    usernames = get_usernames({comment.user_id for comment in comments})
+    return [(comment, usernames.get(comment.user_id)) for comment in comments], has_more
+
+
+def comment_to_dict(comment, username):
+    """Returns a JSON serializable dict of a sqlalchemy Comment table obj"""
+    return {
+        "id": comment.id,
+        "text": comment.text,
+        "username": username,
+        # formatted like the comments rendered on the task page, rather than jsonify's RFC 1123 dates
+        "timestamp": str(comment.timestamp)
+    }
+
+
+def notify(user_id, task_id, task_title, kind, actor_id):
+    """
+    Add a new notification of a kind in NOTIFICATION_KINDS (e.g. "commented") by the user actor_id, associated
+    with a user and a task, with the sql session's next commit.
+    The notification is written by the background notification writer after the commit, or in the same
+    transaction if NOTIFICATIONS_ASYNC is off, and then pushed to the user's open notification streams.
+    Only the kind and the ids are stored, the text is rendered when the notification is read.
+    """
+    sql_session.info.setdefault("notifications", []).append({
+        "user_id": user_id,
+        "task_id": task_id,
+        "kind": NOTIFICATION_KINDS.index(kind),
+        "actor_id": actor_id,
+        # to render the published notification without looking them up again, not stored
+        "actor": get_username(actor_id),
+        "task_title": task_title
+    })
+
+
+def notifications_to_dicts(rows):
+    """Returns the notification dicts of (Notification, task title) rows, looking up the acting users at once"""
+    usernames = get_usernames({notification.actor_id for notification, _ in rows if notification.actor_id})
+    return [notification_to_dict(notification, usernames.get(notification.actor_id), title) for notification, title in rows]
+
+
+def get_notifications_query(user_id, after_id=0):
+    """Returns a query of a user's notifications with their task's title, with an id greater than after_id, newest first"""
+    return (sql_session.query(Notification, Task.title)
+            .join(Task, Task.id == Notification.task_id)
+            .filter(Notification.user_id == user_id, Notification.id > after_id)
+            .order_by(desc(Notification.timestamp), desc(Notification.id))
+            )
 
-# Close the sql session
-sql_session.close()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import bisect
+import threading
+import time
+
+
+class UsernameIndex:
+    """
+    In-memory sorted array of usernames for case-insensitive prefix autocompletion.
+    Loaded on first use, then users registered since (possibly by other workers) are added
+    incrementally at most every refresh_interval seconds.
+    """
+
+    def __init__(self, load_users, refresh_interval=5):
+        # load_users(after_id) returns (id, username) of the users with an id greater than after_id
+        self.load_users = load_users
+        self.refresh_interval = refresh_interval
+        self.entries = []  # sorted (lowercase username, username)
+        self.usernames = set()
+        self.max_id = 0
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        # serializes loading, so concurrent first requests wait for the initial load instead of finding no users
+        self.refresh_lock = threading.Lock()
+
+    def add(self, id, username):
+        """Add a registered user"""
+        with self.lock:
+            if username not in self.usernames:
+                self.usernames.add(username)
+                bisect.insort(self.entries, (username.lower(), username))
+
+    def is_fresh(self):
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.refresh_interval
+
+    def refresh(self, force=False):
+        """Add the users registered since the last refresh"""
+        if not force and self.is_fresh():
+            return
+
+        # once loaded, requests don't wait for another thread's refresh and complete from the current entries
+        if not self.refresh_lock.acquire(blocking=self.refreshed_at is None or force):
+            return
+        try:
+            if not force and self.is_fresh():
+                return
+            users = self.load_users(self.max_id)
+
+            with self.lock:
+                for id, username in users:
+                    self.max_id = max(self.max_id, id)
+                    if username not in self.usernames:
+                        self.usernames.add(username)
+                        self.entries.append((username.lower(), username))
+                # sorting the mostly sorted array is linear
+                self.entries.sort()
+            self.refreshed_at = time.monotonic()
+        finally:
+            self.refresh_lock.release()
+
+    def complete(self, prefix, limit=10):
+        """Returns up to limit usernames starting with prefix (ignoring case) in alphabetical order"""
+        self.refresh()
+
+        prefix = prefix.lower()
+        with self.lock:
+            i = bisect.bisect_left(self.entries, (prefix,))
+            usernames = []
+            while i < len(self.entries) and len(usernames) < limit and self.entries[i][0].startswith(prefix):
+                usernames.append(self.entries[i][1])
+                i += 1
+        return usernames
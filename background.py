@@ -0,0 +1,33 @@
+import threading
+
+
+class BackgroundThread:
+    """
+    Base class of the app's background daemon threads. start() starts the thread lazily, so forking servers start
+    one in each worker, and again if it died; subclasses name it with thread_name and implement run(), which should
+    return once stopped is set if it loops on an interval.
+    """
+
+    thread_name = "background"
+
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the thread unless it's running"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.before_start()
+                self.thread = threading.Thread(target=self.run, name=self.thread_name, daemon=True)
+                self.thread.start()
+
+    def before_start(self):
+        """Called before the thread starts, under the lock"""
+
+    def run(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,354 @@
+"""
+Benchmark the app's routes against a seeded synthetic database.
+
+A temporary SQLite database (or the empty database of DATABASE_URL) is seeded with --users users, --tasks tasks,
+--comments comments and --notifications notifications, then --clients concurrent clients, each logged in as a
+different user, request every route --requests times. The clients are Flask test clients, or with --server HTTP clients of a local threaded
+WSGI server. With --login-load, more clients keep logging in meanwhile, to see how password hashing affects the
+latency of the other routes. For every route the p50/p95/p99 latency, the throughput and the mean number of SQL queries per request
+are reported.
+
+Results can be saved as a baseline and later runs compared against it, the run fails if a route's p95 latency
+got more than --tolerance percent slower or it issues more queries than in the baseline.
+
+usage: python benchmark_routes.py [--users 100] [--tasks 10000] [--requests 200] [--clients 4] [--server] [--login-load 0]
+                                  [--save-baseline baseline.json] [--baseline baseline.json]
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+from script_helpers import use_temporary_environment
+
+PASSWORD = "Benchmark1!"
+
+# words of the synthetic task titles and descriptions, searched by the search_task route
+WORDS = ["login", "bug", "docs", "deploy", "report", "review", "design", "test", "release", "migrate",
+         "database", "cache", "email", "invoice", "search", "notify", "dashboard", "export", "import", "backup"]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Benchmark the app's routes against a seeded synthetic database.")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--notifications", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and client")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--server", action="store_true", help="request a local WSGI server over HTTP")
+    parser.add_argument("--login-load", type=int, default=0,
+                        help="clients logging in continuously in the background while the routes are timed")
+    parser.add_argument("--seed", type=int, default=50, help="random seed of the synthetic data and requests")
+    parser.add_argument("--baseline", help="compare against the results stored in this file")
+    parser.add_argument("--save-baseline", help="store the results in this file")
+    parser.add_argument("--tolerance", type=float, default=20, help="allowed p95 slowdown in percent")
+    return parser.parse_args(args)
+
+
+def seed(engine, options):
+    """Fill the database with synthetic users, tasks, comments and notifications, in bulk"""
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from models import User, Task, Comment, Notification, NOTIFICATION_KINDS, PRIORITY_LEVELS, STATUSES
+    from task_counts import rebuild_task_counts
+
+    rng = random.Random(options.seed)
+    password_hash = generate_password_hash(PASSWORD)
+    today = date.today()
+
+    def sentence(length):
+        return " ".join(rng.choice(WORDS) for _ in range(length))
+
+    rows = {
+        User: [{"id": id, "username": f"user{id}", "hash": password_hash} for id in range(1, options.users + 1)],
+        Task: [{
+            "id": id,
+            "title": sentence(3).capitalize(),
+            "description": sentence(12),
+            "due_date": today + timedelta(days=rng.randint(-30, 90)),
+            "assigner_id": rng.randint(1, options.users),
+            "assignee_id": rng.randint(1, options.users),
+            "priority_id": rng.randrange(len(PRIORITY_LEVELS)),
+            "status_id": rng.randrange(len(STATUSES))
+        } for id in range(1, options.tasks + 1)],
+        Comment: [{
+            "text": sentence(8), "user_id": rng.randint(1, options.users), "task_id": rng.randint(1, options.tasks)
+        } for _ in range(options.comments)],
+        Notification: [{
+            "kind": rng.randrange(len(NOTIFICATION_KINDS)), "actor_id": rng.randint(1, options.users),
+            "user_id": rng.randint(1, options.users), "task_id": rng.randint(1, options.tasks)
+        } for _ in range(options.notifications)]
+    }
+
+    with engine.begin() as connection:
+        for table, table_rows in rows.items():
+            # an insert without rows would insert one row of defaults
+            if table_rows:
+                connection.execute(insert(table), table_rows)
+        rebuild_task_counts(connection)
+
+
+class TestClient:
+    """Requests the app in process with a Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        """Returns the response's status code and number of queries"""
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, int(response.headers.get("X-Query-Count", 0))
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Return redirects instead of following them, so only the requested route is timed"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """Requests a server over HTTP, keeping its session cookie"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None):
+        """Returns the response's status code and number of queries"""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            response = self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method))
+        except urllib.error.HTTPError as error:
+            # redirects are returned as errors since they aren't followed
+            response = error
+        with response:
+            response.read()
+            return response.status, int(response.headers.get("X-Query-Count", 0))
+
+
+def route_requests(rng, user_id, options):
+    """Returns {route: function returning the (method, path, form data) of a request} for a client's user"""
+    return {
+        "login": lambda: ("POST", "/login", {"username": f"user{user_id}", "password": PASSWORD}),
+        "index": lambda: ("GET", "/", None),
+        "search_task": lambda: ("POST", "/search_task", {
+            "text": rng.choice(WORDS), "assignee": "", "assigner": "", "priority_id": "Any", "status_id": "Any"}),
+        "show_task": lambda: ("GET", f"/show_task?id={rng.randint(1, options.tasks)}", None),
+        "add_comment": lambda: ("POST", "/add_comment", {
+            "text": " ".join(rng.choice(WORDS) for _ in range(8)), "task_id": rng.randint(1, options.tasks)}),
+        "get_users": lambda: ("GET", f"/get_users?name=user{rng.randint(1, 9)}", None),
+        "get_notifications": lambda: ("GET", "/get_notifications", None),
+    }
+
+
+def percentile(sorted_values, percent):
+    """Returns the nearest-rank percentile of sorted values"""
+    return sorted_values[max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))]
+
+
+def run(clients, options):
+    """Request every route with all clients concurrently, returns {route: results}"""
+    client_requests = [route_requests(random.Random(options.seed + i), i % options.users + 1, options)
+                       for i in range(len(clients))]
+    results = {}
+
+    for route in client_requests[0]:
+        latencies = []
+        queries = []
+        errors = []
+        lock = threading.Lock()
+
+        def drive(client, make_request):
+            for _ in range(options.requests):
+                method, path, data = make_request()
+                start = time.perf_counter()
+                status, query_count = client.request(method, path, data)
+                latency = time.perf_counter() - start
+                with lock:
+                    latencies.append(latency)
+                    queries.append(query_count)
+                    if status >= 400:
+                        errors.append(status)
+
+        threads = [threading.Thread(target=drive, args=(client, requests[route]))
+                   for client, requests in zip(clients, client_requests)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        results[route] = summarize(latencies, queries, errors, elapsed)
+
+    return results
+
+
+def summarize(latencies, queries, errors, elapsed):
+    """Returns the latency percentiles in ms, throughput and mean queries of a route's requests"""
+    latencies = sorted(latencies)
+    return {
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "throughput": len(latencies) / elapsed,
+        "queries": sum(queries) / len(queries),
+        "errors": len(errors)
+    }
+
+
+def start_login_load(clients, options):
+    """
+    Keep logging the clients in, in background threads, to time the routes while passwords are being hashed.
+    Returns a function stopping the clients and returning the results of their logins.
+    """
+    stop = threading.Event()
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+
+    def log_in(client, user_id):
+        while not stop.is_set():
+            start = time.perf_counter()
+            status, query_count = client.request("POST", "/login", {"username": f"user{user_id}", "password": PASSWORD})
+            latency = time.perf_counter() - start
+            with lock:
+                latencies.append(latency)
+                queries.append(query_count)
+                if status >= 400:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=log_in, args=(client, i % options.users + 1), daemon=True)
+               for i, client in enumerate(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    def finish():
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, queries, errors, time.perf_counter() - start)
+
+    return finish
+
+
+def count_queries(app, engine):
+    """Report the number of SQL statements of each request in its X-Query-Count response header"""
+    from flask import g, has_app_context
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        # statements of background threads (e.g. the notification writer) aren't counted
+        if has_app_context():
+            g.query_count = g.get("query_count", 0) + 1
+
+    @app.after_request
+    def add_query_count(response):
+        response.headers["X-Query-Count"] = str(g.get("query_count", 0))
+        return response
+
+
+def print_results(results, baseline=None):
+    print(f"{'route':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>10}{'errors':>8}"
+          + (f"{'p95 vs baseline':>18}" if baseline else ""))
+    for route, result in results.items():
+        line = (f"{route:<20}{result['p50']:>10.2f}{result['p95']:>10.2f}{result['p99']:>10.2f}"
+                f"{result['throughput']:>10.1f}{result['queries']:>10.1f}{result['errors']:>8}")
+        if baseline and route in baseline:
+            line += f"{(result['p95'] / baseline[route]['p95'] - 1) * 100:>+17.1f}%"
+        print(line)
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of the results against a baseline"""
+    regressions = []
+    for route, result in results.items():
+        if route not in baseline:
+            continue
+        if result["p95"] > baseline[route]["p95"] * (1 + tolerance / 100):
+            regressions.append(f"{route}: p95 {baseline[route]['p95']:.2f} ms -> {result['p95']:.2f} ms")
+        if result["queries"] > baseline[route]["queries"] + 0.5:
+            regressions.append(f"{route}: queries {baseline[route]['queries']:.1f} -> {result['queries']:.1f}")
+    return regressions
+
+
+def main(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+    # the baseline paths are relative to where the benchmark is started
+    options.baseline = options.baseline and os.path.abspath(options.baseline)
+    options.save_baseline = options.save_baseline and os.path.abspath(options.save_baseline)
+
+    # hashing on the app's process pool, as deployed
+    use_temporary_environment("benchmark.db", hash_in_thread=False, keep_database_url=True)
+
+    from app import create_app, get_components
+    app = create_app({"WTF_CSRF_ENABLED": False})
+    engine = get_components(app).engine
+    get_components(app).bootstrap_db()
+
+    print(f"seeding {options.users} users, {options.tasks} tasks, {options.comments} comments, "
+          f"{options.notifications} notifications")
+    seed(engine, options)
+    count_queries(app, engine)
+
+    server = None
+    if options.server:
+        from werkzeug.serving import make_server
+        # don't log every request
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        clients = [HTTPClient(f"http://127.0.0.1:{server.server_port}") for _ in range(options.clients + options.login_load)]
+    else:
+        clients = [TestClient(app) for _ in range(options.clients + options.login_load)]
+    clients, login_load_clients = clients[:options.clients], clients[options.clients:]
+
+    # log every client in before timing the other routes
+    for i, client in enumerate(clients):
+        client.request("POST", "/login", {"username": f"user{i % options.users + 1}", "password": PASSWORD})
+
+    print(f"{options.clients} clients x {options.requests} requests per route"
+          f"{' over HTTP' if options.server else ''}"
+          f"{f', {options.login_load} clients logging in meanwhile' if options.login_load else ''}\n")
+    finish_login_load = login_load_clients and start_login_load(login_load_clients, options)
+    results = run(clients, options)
+    if finish_login_load:
+        results["login (load)"] = finish_login_load()
+    if server:
+        server.shutdown()
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    if options.save_baseline:
+        with open(options.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nsaved baseline to {options.save_baseline}")
+
+    if baseline:
+        if regressions := compare(results, baseline, options.tolerance):
+            print("\nregressions:\n" + "\n".join(regressions))
+            return 1
+        print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
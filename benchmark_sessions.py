@@ -0,0 +1,75 @@
+"""
+Compare the per-request overhead of the session backends.
+
+For every backend a minimal app is requested with a logged in session, once by a route that only reads
+the session and once by a route that changes it, and the mean time per request is reported.
+
+usage: python benchmark_sessions.py [requests per route]
+"""
+import os
+import sys
+import tempfile
+import time
+from flask import Flask, session
+from sessions import SESSION_BACKENDS, init_sessions
+
+
+def create_benchmark_app(backend, directory):
+    """Returns a minimal app using a session backend"""
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "benchmark"
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SESSION_BACKEND"] = backend
+    app.config["SESSION_MEMORY_SIZE"] = 10000
+    app.config["SESSION_SQLITE_PATH"] = os.path.join(directory, "sessions.db")
+    app.config["SESSION_SWEEP_INTERVAL"] = 300
+    app.config["SESSION_FILE_DIR"] = os.path.join(directory, "flask_session")
+    app.config["SESSION_REDIS_URL"] = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379")
+    init_sessions(app)
+
+    @app.route("/login")
+    def login():
+        session["user_id"] = 1
+        session["username"] = "benchmark"
+        return ""
+
+    @app.route("/read")
+    def read():
+        return str(session["user_id"])
+
+    @app.route("/write")
+    def write():
+        session["visits"] = session.get("visits", 0) + 1
+        return ""
+
+    return app
+
+
+def time_requests(client, route, requests):
+    """Returns the mean time in microseconds of requesting a route"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(route)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main(requests=2000):
+    directory = tempfile.mkdtemp()
+    print(f"{'backend':<12}{'read (us)':>12}{'write (us)':>12}")
+
+    for backend in SESSION_BACKENDS:
+        try:
+            app = create_benchmark_app(backend, directory)
+            client = app.test_client()
+            client.get("/login")
+            read = time_requests(client, "/read", requests)
+            write = time_requests(client, "/write", requests)
+        except Exception as error:
+            print(f"{backend:<12}skipped: {error}")
+            continue
+
+        print(f"{backend:<12}{read:>12.1f}{write:>12.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,98 @@
+"""
+Compare the Python CPU time of building the hot queries per call against executing the prebuilt statements in app.py.
+
+The single task look-up, the dashboard's first and next task pages and the newest and older comments pages are run
+against a seeded temporary SQLite database, once built as a new ORM query per call (as before they were prebuilt)
+and once from the prebuilt statements with bound parameters. The mean CPU time per call of each variant and the compiled
+statement cache hit rate of the prebuilt statements are reported (the comments pages' prebuilt variant is the app's
+get_comments(), which also looks up the usernames).
+
+usage: python benchmark_statements.py [calls per query]
+"""
+import sys
+import time
+from collections import Counter
+from script_helpers import use_temporary_environment
+
+
+def main(calls=2000):
+    use_temporary_environment("benchmark.db")
+
+    from sqlalchemy import desc, event, select, tuple_
+    from app import create_app, get_components, get_comments, TASK_BY_ID_STATEMENT, TASK_SORT_KEYS, USER_TASKS_STATEMENTS
+    from benchmark_routes import parse_args, seed
+    from instrumentation import compiled_cache_result
+    from models import Task, Comment, STATUSES
+    from pagination import paginate, paginate_statements
+    app = create_app({"COMMENTS_PAGE_SIZE": 20})
+    components = get_components(app)
+    engine, sql_session = components.engine, components.sql_session
+    components.bootstrap_db()
+
+    options = parse_args(["--users", "50", "--tasks", "5000", "--comments", "20000", "--notifications", "0"])
+    seed(engine, options)
+
+    # a task and its newest comment, to page the comments before it
+    task_id = 1
+    comment_id = sql_session.scalars(
+        select(Comment.id).where(Comment.task_id == task_id).order_by(desc(Comment.id)).limit(1)).first()
+    sort_keys = TASK_SORT_KEYS["due_date"]
+    _, cursor = paginate_statements(sql_session, USER_TASKS_STATEMENTS[(False, "due_date")], "due_date", sort_keys,
+                                    20, None, {"user_id": 1})
+
+    def rebuilt_user_tasks(page_cursor):
+        query = (sql_session.query(Task)
+                 .filter(Task.status_id != STATUSES.index("Closed"))
+                 .filter(Task.assignee_id == 1))
+        return paginate(query, "due_date", sort_keys, 20, page_cursor)
+
+    def rebuilt_comments(before_id):
+        query = sql_session.query(Comment).filter(Comment.task_id == task_id)
+        if before_id:
+            reference_timestamp = select(Comment.timestamp).where(Comment.id == before_id).scalar_subquery()
+            query = query.filter(tuple_(Comment.timestamp, Comment.id) < tuple_(reference_timestamp, before_id))
+        return query.order_by(desc(Comment.timestamp), desc(Comment.id)).limit(21).all()
+
+    def prebuilt_user_tasks(page_cursor):
+        return paginate_statements(sql_session, USER_TASKS_STATEMENTS[(False, "due_date")], "due_date", sort_keys,
+                                   20, page_cursor, {"user_id": 1})
+
+    benchmarks = [
+        ("task by id", lambda: sql_session.query(Task).filter_by(id=task_id).first(),
+         lambda: sql_session.scalars(TASK_BY_ID_STATEMENT, {"id": task_id}).first()),
+        ("dashboard first page", lambda: rebuilt_user_tasks(None), lambda: prebuilt_user_tasks(None)),
+        ("dashboard next page", lambda: rebuilt_user_tasks(cursor), lambda: prebuilt_user_tasks(cursor)),
+        ("newest comments", lambda: rebuilt_comments(None), lambda: get_comments(task_id)),
+        ("older comments", lambda: rebuilt_comments(comment_id), lambda: get_comments(task_id, before_id=comment_id)),
+    ]
+
+    cache_results = Counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def count_cache_result(conn, cursor, statement, parameters, context, executemany):
+        cache_results[compiled_cache_result(context)] += 1
+
+    def time_calls(function):
+        """Returns the mean CPU time in microseconds of a call and the compiled cache hit rate"""
+        # warm up the compiled cache and the username cache
+        function()
+        cache_results.clear()
+        start = time.process_time()
+        for _ in range(calls):
+            function()
+            # don't let the identity map keep the loaded objects
+            sql_session.expunge_all()
+        elapsed = time.process_time() - start
+        return elapsed / calls * 1e6, cache_results["hit"] / max(sum(cache_results.values()), 1) * 100
+
+    print(f"{'query':<24}{'rebuilt (us)':>14}{'prebuilt (us)':>15}{'saved':>8}{'cache hits':>12}")
+    with app.test_request_context():
+        for name, rebuilt, prebuilt in benchmarks:
+            rebuilt_time, _ = time_calls(rebuilt)
+            prebuilt_time, hit_rate = time_calls(prebuilt)
+            print(f"{name:<24}{rebuilt_time:>14.1f}{prebuilt_time:>15.1f}"
+                  f"{(1 - prebuilt_time / rebuilt_time) * 100:>7.0f}%{hit_rate:>11.0f}%")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import date
+from itertools import islice
+from sqlalchemy import insert, select
+from models import Task, TaskEvent, User, PRIORITY_LEVELS, STATUSES
+from task_counts import apply_task_count_deltas, task_count_keys
+from task_events import created_event
+
+# import/export formats and their content types
+FORMATS = {"csv": "text/csv", "jsonl": "application/jsonl"}
+CONTENT_TYPE_FORMATS = {"text/csv": "csv", "application/jsonl": "jsonl", "application/x-ndjson": "jsonl"}
+
+# columns of exported tasks, imports accept the same columns (the id and timestamp are ignored)
+EXPORT_COLUMNS = ["id", "title", "description", "assignee", "assigner", "priority", "status", "due_date", "timestamp"]
+
+# stop reporting invalid rows after this many
+MAX_IMPORT_ERRORS = 100
+
+
+class InvalidTaskRow(ValueError):
+    """An imported row isn't a valid task"""
+
+
+def get_format(format, content_type=None):
+    """Returns the import/export format from a format name or a content type (None if it isn't supported)"""
+    if format in FORMATS:
+        return format
+    return CONTENT_TYPE_FORMATS.get((content_type or "").split(";")[0].strip())
+
+
+def read_rows(lines, format):
+    """
+    Yields (line number, row dict) of an iterable of CSV (with a header row) or JSON lines.
+    Rows that can't be parsed are yielded as an InvalidTaskRow instead of a dict.
+    """
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, InvalidTaskRow(f"Invalid JSON: {error}")
+            continue
+        yield line_number, row if isinstance(row, dict) else InvalidTaskRow("Not a JSON object")
+
+
+def parse_lookup(value, names, field):
+    """Returns the look-up id of a name (ignoring case) or an id"""
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+        id = int(value)
+        if 0 <= id < len(names):
+            return id
+    elif isinstance(value, str):
+        lowercase_names = [name.lower() for name in names]
+        if value.strip().lower() in lowercase_names:
+            return lowercase_names.index(value.strip().lower())
+    raise InvalidTaskRow(f"Invalid {field}: {value!r}")
+
+
+def parse_task(row, assigner, user_ids, allow_assigner):
+    """Returns the Task column values of an imported row, with the usernames resolved by user_ids"""
+    title = str(row.get("title") or "").strip()
+    if not title:
+        raise InvalidTaskRow("Missing title")
+
+    assignee = str(row.get("assignee") or "")
+    if (assignee_id := user_ids.get(assignee)) is None:
+        raise InvalidTaskRow(f"Invalid assignee: {assignee!r}")
+
+    if allow_assigner and row.get("assigner"):
+        assigner = str(row["assigner"])
+    if (assigner_id := user_ids.get(assigner)) is None:
+        raise InvalidTaskRow(f"Invalid assigner: {assigner!r}")
+
+    try:
+        due_date = date.fromisoformat(str(row.get("due_date")))
+    except ValueError:
+        raise InvalidTaskRow(f"Invalid due date: {row.get('due_date')!r}")
+
+    priority = row.get("priority", row.get("priority_id"))
+    status = row.get("status", row.get("status_id"))
+
+    return {
+        "title": title,
+        "description": str(row.get("description") or ""),
+        "assignee_id": assignee_id,
+        "assigner_id": assigner_id,
+        "due_date": due_date,
+        "priority_id": parse_lookup(priority, PRIORITY_LEVELS, "priority") if priority not in (None, "") else 0,
+        "status_id": parse_lookup(status, STATUSES, "status") if status not in (None, "") else 0
+    }
+
+
+def import_tasks(sql_session, rows, assigner, notify, chunk_size=1000, allow_assigner=False):
+    """
+    Create tasks from (line number, row dict) rows, e.g. from read_rows(), assigned by the user named assigner
+    (or by the row's "assigner" if allow_assigner).
+    Each chunk of rows costs one query resolving its usernames, one multi-row insert of the tasks (and one of their
+    task counts and events) and one commit, and notify(user id, task id, task title, "assigned", assigner id) is
+    called for the new tasks' assignees before the chunk is committed.
+    Invalid rows are skipped. Returns the number of imported tasks and up to MAX_IMPORT_ERRORS
+    {"line": line number, "error": message} of the skipped rows.
+    """
+    imported = 0
+    errors = []
+    rows = iter(rows)
+
+    while chunk := list(islice(rows, chunk_size)):
+        usernames = {assigner}
+        for _, row in chunk:
+            if isinstance(row, dict):
+                usernames.update(str(row.get(column) or "") for column in ("assignee", "assigner"))
+        user_ids = dict(sql_session.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
+
+        tasks = []
+        for line_number, row in chunk:
+            try:
+                if isinstance(row, InvalidTaskRow):
+                    raise row
+                tasks.append(parse_task(row, assigner, user_ids, allow_assigner))
+            except InvalidTaskRow as error:
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append({"line": line_number, "error": str(error)})
+
+        if not tasks:
+            continue
+
+        inserted = sql_session.execute(
+            insert(Task).returning(Task.id, Task.title, Task.assignee_id, Task.assigner_id), tasks).all()
+
+        # bulk inserts aren't flushed by the session, so the dashboard counts and the task events are written here
+        apply_task_count_deltas(sql_session.connection(), Counter(
+            key for task in tasks for key in task_count_keys(task)))
+        sql_session.execute(insert(TaskEvent), [
+            created_event(id, assignee_id, assigner_id, assigner_id) for id, _, assignee_id, assigner_id in inserted])
+
+        for id, title, assignee_id, assigner_id in inserted:
+            if assignee_id != assigner_id:
+                notify(assignee_id, id, title, "assigned", assigner_id)
+
+        sql_session.commit()
+        imported += len(inserted)
+
+    return imported, errors
+
+
+def task_to_row(task, assignee, assigner, priority, status):
+    """Returns an exported row of a task joined with its look-up values"""
+    return {
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "assignee": assignee,
+        "assigner": assigner,
+        "priority": priority,
+        "status": status,
+        "due_date": task.due_date.isoformat(),
+        "timestamp": str(task.timestamp)
+    }
+
+
+def write_rows(pages, format):
+    """Yields the CSV (starting with a header row) or JSON lines of pages of exported rows, a page at a time"""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_COLUMNS)
+        writer.writeheader()
+        for page in pages:
+            writer.writerows(page)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+
+    for page in pages:
+        yield "".join(json.dumps(row) + "\n" for row in page)
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# returned by caches and stores for keys they don't have (None is a valid cached value)
+MISSING = object()
+
+
+class SQLiteStore:
+    """
+    Key-value store with expiry in a local SQLite file.
+    Shared by all worker processes on a node, values must be JSON serializable.
+    """
+
+    def __init__(self, path, table="cache", ttl=None):
+        self.path = path
+        self.table = table
+        # default time to live in seconds of set keys
+        self.ttl = ttl
+        self.local = threading.local()
+
+    def connection(self):
+        """Returns this thread's connection to the store"""
+        if (connection := getattr(self.local, "connection", None)) is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # the table is created on first use rather than on construction, so configuring a store is free
+            with connection:
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expires_at_index ON {self.table} (expires_at)")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self.connection().execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return MISSING
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        with self.connection() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+
+    def delete(self, key):
+        with self.connection() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.connection() as connection:
+            connection.execute(f"DELETE FROM {self.table}")
+
+    def sweep(self):
+        """Delete expired keys"""
+        with self.connection() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache holding at most max_size keys, evicting the least recently used,
+    with an optional time to live in seconds.
+    With a store (e.g. SQLiteStore), keys missing in process are looked up in the store and sets and
+    deletes are written through to it, so worker processes share entries.
+    """
+
+    def __init__(self, max_size=1024, ttl=None, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            if (entry := self.entries.get(key)) is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+
+        if self.store is not None and (value := self.store.get(key)) is not MISSING:
+            self._set(key, value)
+            with self.lock:
+                self.store_hits += 1
+            return value
+
+        with self.lock:
+            self.misses += 1
+        return default
+
+    def get_or_set(self, key, make_value):
+        """Returns a key's value, setting it to make_value() if it's missing"""
+        if (value := self.get(key)) is MISSING:
+            value = make_value()
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+        if self.store is not None:
+            self.store.set(key, value, self.ttl)
+
+    def _set(self, key, value):
+        """Set a key in process only"""
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl if self.ttl else None)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        """Returns the cache's hit and miss counters and size"""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "size": len(self.entries),
+                "max_size": self.max_size
+            }
+
+
+def cache_metrics_lines(caches):
+    """Returns the hit and miss counters and sizes of named LRUCaches ({name: cache}) in the Prometheus text format"""
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    lines = ["# HELP cache_requests_total Cache look-ups by cache and result.", "# TYPE cache_requests_total counter"]
+    for name, cache_stats in stats.items():
+        for result, key in (("hit", "hits"), ("store_hit", "store_hits"), ("miss", "misses")):
+            lines.append(f'cache_requests_total{{cache="{name}",result="{result}"}} {cache_stats[key]}')
+    lines += ["# HELP cache_entries Entries in the in-process cache by cache.", "# TYPE cache_entries gauge"]
+    for name, cache_stats in stats.items():
+        lines.append(f'cache_entries{{cache="{name}"}} {cache_stats["size"]}')
+    return lines
@@ -0,0 +1,57 @@
+"""
+Check that a collapsed comment notification reaches clients that only fetch notifications after their newest id.
+
+On a temporary SQLite database, an assigner comments on a task twice. The assignee's unread notification of the first
+comment is collapsed with the second one into a notification counting both, which must be returned by
+/get_notifications?after_id=<the first notification's id> and sent on a notification stream opened after the first
+comment. The check also fails if the task is renamed and that changes the text of its earlier notifications.
+
+usage: python check_notifications.py
+"""
+import sys
+from script_helpers import register_client, use_temporary_environment
+
+
+def main():
+    # the test client reads the stream's first event (a heartbeat) when it's requested
+    use_temporary_environment("check_notifications.db", NOTIFICATIONS_ASYNC="0", NOTIFICATIONS_HEARTBEAT="1")
+
+    from app import create_app
+    app = create_app({"WTF_CSRF_ENABLED": False})
+
+    assigner, assignee = register_client(app, "assigner"), register_client(app, "assignee")
+
+    task = {"title": "Collapse me", "description": "", "assignee": "assignee", "due_date": "2030-01-01",
+            "priority_id": "1"}
+    assigner.post("/new_task", data=task)
+    assigner.post("/add_comment", data={"text": "First", "task_id": 1})
+    first_id = max(notification["id"] for notification in assignee.get("/get_notifications").json)
+
+    # the stream subscribes when it's requested, before the second comment
+    stream = assignee.get(f"/notifications/stream?after_id={first_id}", buffered=False)
+    assigner.post("/add_comment", data={"text": "Second", "task_id": 1})
+    events = iter(stream.response)
+    streamed = next((event.decode() for event, _ in zip(events, range(5)) if event.startswith(b"id:")), "")
+    stream.close()
+
+    failures = []
+    fetched = assignee.get(f"/get_notifications?after_id={first_id}").json
+    if not any(notification["count"] == 2 for notification in fetched):
+        failures.append(f"the collapsed notification isn't fetched after id {first_id}: {fetched}")
+    if '"count": 2' not in streamed and '"count":2' not in streamed:
+        failures.append(f"the collapsed notification isn't streamed after id {first_id}: {streamed!r}")
+
+    texts = [notification["text"] for notification in assignee.get("/get_notifications").json]
+    assigner.post("/edit_task", data={**task, "id": 1, "title": "Renamed", "status_id": "0"})
+    renamed_texts = [notification["text"] for notification in assignee.get("/get_notifications").json][-len(texts):]
+    if renamed_texts != texts:
+        failures.append(f"renaming the task changed its notifications: {texts} -> {renamed_texts}")
+
+    print(f"fetched after id {first_id}: {fetched}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Check that the app's hot queries use the indexes meant for them.
+
+Requests the dashboard, notifications and show task routes against a small temporary SQLite database
+and fails if the EXPLAIN QUERY PLAN of a query doesn't use its expected index, or sorts the rows of a query
+whose order should come from its index.
+
+usage: python check_query_plans.py
+"""
+import sys
+from sqlalchemy import event
+from script_helpers import use_temporary_environment
+
+# (route, a fragment of the query's SQL, the index the query plan must use)
+EXPECTED_PLANS = [
+    ("/", "tasks.assignee_id = ?", "assignee_due_date_index"),
+    ("/", "tasks.assigner_id = ?", "assigner_due_date_index"),
+    ("/", "FROM task_counts", "sqlite_autoindex_task_counts_1"),
+    ("/", "tasks.due_date < ?", "assignee_due_date_index"),
+    ("/get_notifications", "FROM notifications", "notification_user_timestamp_index"),
+    ("/show_task?id=1", "FROM comments", "comment_task_timestamp_index"),
+    ("/get_comments?task_id=1&before_id=1", "FROM comments", "comment_task_timestamp_index"),
+    ("/get_comments?task_id=1&after_id=1", "FROM comments", "comment_task_timestamp_index"),
+    ("/task_events?since=0", "task_events.assignee_id = ?", "task_event_assignee_id_index"),
+    ("/task_events?since=0", "task_events.assigner_id = ?", "task_event_assigner_id_index"),
+    ("/task_events?since=0", "task_events.previous_assignee_id = ?", "task_event_previous_assignee_id_index"),
+    ("/task_events?since=0", "task_events.previous_assigner_id = ?", "task_event_previous_assigner_id_index"),
+]
+
+# (route, a fragment of the query's SQL) of the queries whose order must come from their index, not a sort
+INDEX_ORDERED = [
+    ("/task_events?since=0", "task_events.assignee_id = ?"),
+    ("/task_events?since=0", "task_events.assigner_id = ?"),
+    ("/task_events?since=0", "task_events.previous_assignee_id = ?"),
+    ("/task_events?since=0", "task_events.previous_assigner_id = ?"),
+]
+
+
+def seed(sql_session):
+    """Add a couple of users with a task, a comment and a notification"""
+    from models import User, Task, Comment, Notification
+    from datetime import date
+
+    sql_session.add_all([User(id=1, username="assigner", hash="-"), User(id=2, username="assignee", hash="-")])
+    sql_session.add(Task(id=1, title="Task", due_date=date.today(), assigner_id=1, assignee_id=2))
+    sql_session.add(Comment(text="Comment", user_id=2, task_id=1))
+    sql_session.add(Notification(kind=0, actor_id=2, user_id=1, task_id=1))
+    sql_session.commit()
+
+
+def main():
+    use_temporary_environment("check_query_plans.db")
+
+    from app import create_app, get_components
+    app = create_app()
+    components = get_components(app)
+    engine = components.engine
+    components.bootstrap_db()
+
+    with components.SQL_Session() as sql_session:
+        seed(sql_session)
+
+    # record the statements issued by each request
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+        session["username"] = "assigner"
+
+    failures = 0
+    for route, fragment, index in EXPECTED_PLANS:
+        statements.clear()
+        client.get(route)
+
+        queries = [(statement, parameters) for statement, parameters in statements if fragment in statement]
+        if not queries:
+            print(f"FAIL {route}: no query containing {fragment!r}")
+            failures += 1
+
+        for statement, parameters in queries:
+            with engine.connect() as connection:
+                plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plan = "; ".join(row[-1] for row in plan)
+
+            if (route, fragment) in INDEX_ORDERED and "USE TEMP B-TREE" in plan:
+                print(f"FAIL {route}: {fragment!r} is sorted with a temporary b-tree\n     plan: {plan}")
+                failures += 1
+            elif index in plan:
+                print(f"ok   {route}: {fragment!r} uses {index}")
+            else:
+                print(f"FAIL {route}: {fragment!r} doesn't use {index}\n     plan: {plan}")
+                failures += 1
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
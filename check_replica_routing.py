@@ -0,0 +1,153 @@
+"""
+Check that heavy searches don't hold up writers once read-only routes run on a read replica.
+
+A temporary SQLite database is seeded with --tasks tasks, then for each setup --searchers clients keep requesting
+broad searches while one writer client adds comments for --seconds seconds:
+- "primary": no replicas, searches and writes share the primary engine and its connection pool
+- "replica": DATABASE_REPLICA_URLS is a read-only connection to the same SQLite file (WAL mode lets it read while
+  the primary writes), so the searches use the replica engine's connections
+Each setup runs in its own process, since the app reads its configuration on import. The writer's p50/p95/max
+latency and the number of writes and searches are reported. With more searchers than the primary's pool has
+connections, writers sharing the pool wait for a connection; the check fails unless the writer's p95 latency with the
+replica is at most --max-write-ratio of the latency without it, or if a search ran on the primary with the replica.
+
+usage: python check_replica_routing.py [--tasks 20000] [--searchers 20] [--seconds 10] [--max-write-ratio 0.5]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from script_helpers import login_client, use_temporary_environment
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Check that heavy searches don't hold up writers with a read replica.")
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--searchers", type=int, default=20, help="concurrent search clients")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each setup")
+    parser.add_argument("--max-write-ratio", type=float, default=0.5,
+                        help="allowed p95 write latency with the replica relative to without it")
+    parser.add_argument("--setup", choices=["primary", "replica"], help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def run_setup(options):
+    """Run the searchers and the writer against the app (configured by the environment), print the results as JSON"""
+    from app import create_app, get_components
+    from benchmark_routes import PASSWORD, WORDS, percentile
+    from sqlalchemy import event
+
+    app = create_app({"WTF_CSRF_ENABLED": False})
+    components = get_components(app)
+    engine, replica_engines = components.engine, components.replica_engines
+
+    # count the searches' statements by engine
+    engine_queries = {"primary": 0, "replica": 0}
+    lock = threading.Lock()
+
+    def count_queries(name):
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT") and threading.current_thread().name.startswith("search"):
+                with lock:
+                    engine_queries[name] += 1
+        return after_cursor_execute
+
+    event.listen(engine, "after_cursor_execute", count_queries("primary"))
+    for replica_engine in replica_engines:
+        event.listen(replica_engine, "after_cursor_execute", count_queries("replica"))
+
+    def login(user_id):
+        client = login_client(app, f"user{user_id}", PASSWORD)
+        # the login's own writes (e.g. a rehashed password) would read from the primary for a while
+        with client.session_transaction() as session:
+            session.pop("read_primary_until", None)
+        return client
+
+    stop = threading.Event()
+    searches = []
+    write_latencies = []
+
+    def search(client, rng):
+        while not stop.is_set():
+            client.post("/search_task", data={
+                "text": rng.choice(WORDS), "assignee": "", "assigner": "", "priority_id": "Any", "status_id": "Any"})
+            with lock:
+                searches.append(1)
+
+    def write(client, rng):
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.post("/add_comment", data={"text": "Progress update", "task_id": rng.randint(1, options.tasks)})
+            write_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=search, args=(login(i % 50 + 1), random.Random(i)), name=f"search-{i}")
+               for i in range(options.searchers)]
+    threads.append(threading.Thread(target=write, args=(login(1), random.Random(-1)), name="writer"))
+    for thread in threads:
+        thread.start()
+    time.sleep(options.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(write_latencies)
+    print(json.dumps({
+        "writes": len(latencies),
+        "write_p50_ms": percentile(latencies, 50) * 1000,
+        "write_p95_ms": percentile(latencies, 95) * 1000,
+        "write_max_ms": latencies[-1] * 1000,
+        "searches": len(searches),
+        "search_queries": engine_queries
+    }))
+
+
+def main(args):
+    options = parse_args(args)
+    if options.setup:
+        return run_setup(options)
+
+    directory = use_temporary_environment(
+        "check_replica_routing.db", SQL_INSTRUMENTATION="0", DATABASE_REPLICA_URLS="", SQLITE_BACKUP_REPLICA="")
+    database = os.path.join(directory, "check_replica_routing.db")
+    environment = dict(os.environ)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from models import create_db, create_db_engine
+    from benchmark_routes import parse_args as parse_benchmark_args, seed
+
+    engine = create_db_engine(environment["DATABASE_URL"])
+    create_db(engine)
+    seed(engine, parse_benchmark_args(["--users", "50", "--tasks", str(options.tasks), "--comments", "0",
+                                       "--notifications", "0"]))
+    engine.dispose()
+
+    print(f"{options.searchers} searchers and 1 writer for {options.seconds:g}s per setup, {options.tasks} tasks\n")
+    print(f"{'setup':<10}{'writes':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'searches':>10}  search queries by engine")
+    results = {}
+    for setup, replica_urls in (("primary", ""), ("replica", f"sqlite:///file:{database}?mode=ro&uri=true")):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *args, "--setup", setup],
+            env=dict(environment, DATABASE_REPLICA_URLS=replica_urls), capture_output=True, text=True, check=True
+        ).stdout
+        results[setup] = result = json.loads(output.strip().splitlines()[-1])
+        print(f"{setup:<10}{result['writes']:>8}{result['write_p50_ms']:>10.1f}{result['write_p95_ms']:>10.1f}"
+              f"{result['write_max_ms']:>10.1f}{result['searches']:>10}  {result['search_queries']}")
+
+    failures = []
+    if results["replica"]["search_queries"]["primary"]:
+        failures.append("searches ran on the primary with a replica configured")
+    if results["replica"]["write_p95_ms"] > options.max_write_ratio * results["primary"]["write_p95_ms"]:
+        failures.append(f"p95 write latency with the replica is above {options.max_write_ratio:g} of the latency without it")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
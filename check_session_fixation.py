@@ -0,0 +1,92 @@
+"""
+Check that the server-side session backends issue a new session id when a user logs in and out.
+
+For each backend a user registers and logs out, then an attacker gets a session id from the login page and plants
+it in the victim's client before the victim logs in. The check fails if the victim's session id after login is the
+planted one, if the attacker's client with the planted id can open the victim's dashboard, or if the id is kept
+after logging out. Each backend runs in its own process, since the app reads its configuration on import.
+
+usage: python check_session_fixation.py [--backends memory sqlite filesystem]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from script_helpers import PASSWORD, register_client, temporary_environment
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Check that session ids change across login and logout.")
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite", "filesystem"])
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def session_id(client, app):
+    cookie = client.get_cookie(app.config.get("SESSION_COOKIE_NAME", "session"))
+    return cookie.value if cookie else None
+
+
+def run_backend(app):
+    """Try to fix a session id with the app (configured by the environment), print the results as JSON"""
+    credentials = {"username": "victim", "password": PASSWORD}
+
+    victim = register_client(app, "victim")
+    victim.get("/logout")
+
+    # the attacker gets a session id of their own and plants it in the victim's browser
+    attacker = app.test_client()
+    attacker.get("/login")
+    planted = session_id(attacker, app)
+    victim = app.test_client()
+    victim.set_cookie(app.config.get("SESSION_COOKIE_NAME", "session"), planted)
+
+    victim.post("/login", data=credentials)
+    logged_in = session_id(victim, app)
+    dashboard = victim.get("/").status_code
+    attacker_dashboard = attacker.get("/").status_code
+
+    victim.get("/logout")
+    print(json.dumps({
+        "planted": bool(planted),
+        "victim_dashboard": dashboard,
+        "changed_on_login": logged_in not in (None, planted),
+        "attacker_dashboard": attacker_dashboard,
+        "changed_on_logout": session_id(victim, app) != logged_in
+    }))
+
+
+def main(args):
+    options = parse_args(args)
+    if options.backend:
+        from app import create_app
+        return run_backend(create_app({"WTF_CSRF_ENABLED": False}))
+
+    failures = []
+    for backend in options.backends:
+        directory, environment = temporary_environment(
+            "check.db", SESSION_BACKEND=backend, SESSION_SQLITE_PATH="sessions.db", SQL_INSTRUMENTATION="0")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--backend", backend], env=environment, cwd=directory,
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{backend:<12}{result}")
+
+        if not result["planted"] or result["victim_dashboard"] != 200:
+            failures.append(f"{backend}: the victim couldn't log in")
+        if not result["changed_on_login"]:
+            failures.append(f"{backend}: the session id didn't change on login")
+        if result["attacker_dashboard"] == 200:
+            failures.append(f"{backend}: the planted session id opens the victim's dashboard")
+        if not result["changed_on_logout"]:
+            failures.append(f"{backend}: the session id didn't change on logout")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,180 @@
+"""
+Check the app's cold start: the time and memory it takes a fresh process to import the app, create it with
+create_app(), bootstrap the database and serve its first request.
+
+Each run is a new Python process against a fresh temporary SQLite database. It imports the modules app.py imports,
+in app.py's order, recording the time and RSS growth of each (a module's cost includes the modules it's the first to
+import), then imports app itself, calls create_app(), bootstraps the database and requests the login page. The
+per-module report is printed for the fastest of --runs runs, along with the slowest imports of one more run started
+with -X importtime (which slows imports down, so it's left out of the budgets). The check fails if the import,
+create_app(), the first request or the whole cold start took longer than their budget, or if the process's RSS grew
+above --max-rss-mb.
+
+usage: python check_startup.py [--runs 3] [--max-import-ms 1000] [--max-create-app-ms 100] [--max-cold-start-ms 1500]
+                               [--max-rss-mb 120]
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from script_helpers import temporary_environment
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Check the app's cold start time and memory.")
+    parser.add_argument("--runs", type=int, default=3, help="processes started, the fastest one is reported")
+    parser.add_argument("--max-import-ms", type=float, default=1000, help="budget of importing the app")
+    parser.add_argument("--max-create-app-ms", type=float, default=100,
+                        help="budget of create_app(), which builds its components lazily")
+    parser.add_argument("--max-first-request-ms", type=float, default=500, help="budget of the first request")
+    parser.add_argument("--max-cold-start-ms", type=float, default=1500,
+                        help="budget of the import, create_app(), the database bootstrap and the first request together")
+    parser.add_argument("--max-rss-mb", type=float, default=120, help="budget of the RSS after the first request")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports of -X importtime to print")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def rss_mb():
+    """Returns the resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # peak rather than current RSS, in KB on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def app_imports():
+    """Returns the top-level modules imported by app.py, in order"""
+    with open(os.path.join(DIRECTORY, "app.py")) as file:
+        tree = ast.parse(file.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        else:
+            continue
+        modules += [name for name in names if name not in modules]
+    return modules
+
+
+def measure():
+    """
+    Import the app's modules one at a time, then the app, create and bootstrap it and serve a request, print the
+    results as JSON
+    """
+    import importlib
+
+    # modules imported by this script, which -X importtime reports before the app's
+    preloaded = sorted(sys.modules)
+    modules = []
+    for name in app_imports():
+        rss = rss_mb()
+        start = time.perf_counter()
+        importlib.import_module(name)
+        modules.append({"module": name, "ms": (time.perf_counter() - start) * 1000, "rss_mb": rss_mb() - rss})
+
+    phases = {}
+    start = time.perf_counter()
+    import app
+    phases["import_ms"] = (time.perf_counter() - start) * 1000 + sum(module["ms"] for module in modules)
+
+    start = time.perf_counter()
+    application = app.create_app()
+    phases["create_app_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    app.get_components(application).bootstrap_db()
+    phases["bootstrap_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    response = application.test_client().get("/login")
+    phases["first_request_ms"] = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"GET /login returned {response.status_code}")
+
+    phases["cold_start_ms"] = (phases["import_ms"] + phases["create_app_ms"] + phases["bootstrap_ms"]
+                               + phases["first_request_ms"])
+    phases["rss_mb"] = rss_mb()
+    print(json.dumps({"modules": modules, "phases": phases, "preloaded": preloaded}))
+
+
+def slowest_imports(importtime_output, top, skipped=()):
+    """Returns the (cumulative us, self us, module) of the slowest top-level imports in -X importtime's output"""
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented under the import that triggered them
+        if name.startswith(" ") and not name.startswith("  ") and name.strip() not in skipped:
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main(args):
+    options = parse_args(args)
+    if options.measure:
+        return measure()
+
+    directory, environment = temporary_environment("check_startup.db")
+
+    def run(*python_options):
+        # a fresh database for each run, so every run bootstraps it
+        database = os.path.join(directory, "check_startup.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+        process = subprocess.run(
+            [sys.executable, *python_options, os.path.abspath(__file__), "--measure"],
+            env=environment, cwd=directory, capture_output=True, text=True, check=True
+        )
+        return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+    result = min((run()[0] for _ in range(options.runs)), key=lambda result: result["phases"]["cold_start_ms"])
+    phases = result["phases"]
+    importtime_result, importtime_output = run("-X", "importtime")
+
+    print(f"fastest of {options.runs} cold starts, modules in app.py's import order\n")
+    print(f"{'module':<24}{'import ms':>10}{'RSS MB':>9}")
+    for module in result["modules"]:
+        print(f"{module['module']:<24}{module['ms']:>10.1f}{module['rss_mb']:>9.1f}")
+
+    print(f"\n{'cumulative ms':>14}{'self ms':>9}  slowest imports (-X importtime)")
+    for cumulative_us, self_us, name in slowest_imports(importtime_output, options.top, importtime_result["preloaded"]):
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>9.1f}  {name}")
+
+    print(f"\nimport app        {phases['import_ms']:>8.1f} ms  (budget {options.max_import_ms:g})")
+    print(f"create_app()      {phases['create_app_ms']:>8.1f} ms  (budget {options.max_create_app_ms:g})")
+    print(f"bootstrap_db()    {phases['bootstrap_ms']:>8.1f} ms")
+    print(f"first request     {phases['first_request_ms']:>8.1f} ms  (budget {options.max_first_request_ms:g})")
+    print(f"cold start        {phases['cold_start_ms']:>8.1f} ms  (budget {options.max_cold_start_ms:g})")
+    print(f"RSS               {phases['rss_mb']:>8.1f} MB  (budget {options.max_rss_mb:g})")
+
+    failures = [f"{name} is over budget" for name, value, budget in (
+        ("import app", phases["import_ms"], options.max_import_ms),
+        ("create_app()", phases["create_app_ms"], options.max_create_app_ms),
+        ("the first request", phases["first_request_ms"], options.max_first_request_ms),
+        ("the cold start", phases["cold_start_ms"], options.max_cold_start_ms),
+        ("RSS", phases["rss_mb"], options.max_rss_mb)
+    ) if value > budget]
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
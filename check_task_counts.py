@@ -0,0 +1,69 @@
+"""
+Check that the task counts are kept in step with the tasks through the task routes.
+
+A temporary SQLite database gets two users and a task created through /new_task. The task is then saved through
+/edit_task with its current values, which the form submits as strings: the check fails if this no-op edit wrote to
+the task counts. The task's priority and status are then changed, and the check fails unless the task counts match
+the ones recounted from the tasks.
+
+usage: python check_task_counts.py
+"""
+import sys
+from collections import Counter
+from sqlalchemy import event, select
+from script_helpers import register_client, use_temporary_environment
+
+
+def main():
+    use_temporary_environment("check_task_counts.db")
+
+    from app import create_app, get_components
+    from models import Task, TaskCount
+    from task_counts import task_count_keys, COUNTED_COLUMNS
+
+    app = create_app({"WTF_CSRF_ENABLED": False})
+    engine = get_components(app).engine
+    register_client(app, "assignee")
+    client = register_client(app, "assigner")
+    task = {"title": "Count me", "description": "", "assignee": "assignee", "due_date": "2030-01-01", "priority_id": "1"}
+    client.post("/new_task", data=task)
+
+    with engine.connect() as connection:
+        task_id, status_id = connection.execute(select(Task.id, Task.status_id)).one()
+
+    # record the statements writing the task counts
+    count_writes = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record_count_write(conn, cursor, statement, parameters, context, executemany):
+        if "task_counts" in statement and not statement.lstrip().upper().startswith("SELECT"):
+            count_writes.append(statement)
+
+    failures = []
+    client.post("/edit_task", data={**task, "id": task_id, "status_id": str(status_id)})
+    no_op_writes = len(count_writes)
+    if no_op_writes:
+        failures.append(f"a no-op edit wrote the task counts: {count_writes}")
+
+    client.post("/edit_task", data={**task, "id": task_id, "priority_id": "2", "status_id": str(status_id + 1)})
+
+    with engine.connect() as connection:
+        tasks = connection.execute(select(*(getattr(Task, column) for column in COUNTED_COLUMNS))).mappings()
+        expected = Counter(key for values in tasks for key in task_count_keys(values))
+        counts = Counter({
+            (user_id, role, status_id, priority_id): count
+            for user_id, role, status_id, priority_id, count in connection.execute(
+                select(TaskCount.user_id, TaskCount.role, TaskCount.status_id, TaskCount.priority_id, TaskCount.count))
+            if count
+        })
+    if counts != expected:
+        failures.append(f"the task counts {dict(counts)} don't match the tasks {dict(expected)}")
+
+    print(f"{no_op_writes} task count writes on a no-op edit, task counts {dict(counts)}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
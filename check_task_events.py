@@ -0,0 +1,45 @@
+"""
+Check that a reassigned task's change reaches the events of the user it was taken from.
+
+On a temporary SQLite database, an assigner creates a task for one user and reassigns it to another. The check fails
+unless /task_events of the previous assignee has the reassigning event, with the previous assignee's id, and the new
+assignee's events have it too.
+
+usage: python check_task_events.py
+"""
+import json
+import sys
+from script_helpers import register_client, use_temporary_environment
+
+
+def main():
+    use_temporary_environment("check_task_events.db")
+
+    from app import create_app
+    app = create_app({"WTF_CSRF_ENABLED": False})
+
+    clients = {username: register_client(app, username) for username in ("assigner", "previous", "next")}
+    user_ids = {username: index for index, username in enumerate(clients, 1)}
+
+    task = {"title": "Reassign me", "description": "", "assignee": "previous", "due_date": "2030-01-01",
+            "priority_id": "1"}
+    clients["assigner"].post("/new_task", data=task)
+    clients["assigner"].post("/edit_task", data={**task, "id": 1, "assignee": "next", "status_id": "0"})
+
+    failures = []
+    for username in ("previous", "next"):
+        events = [json.loads(line) for line in clients[username].get("/task_events?since=0").text.splitlines()]
+        reassigned = [event for event in events if event["field"] == "assignee_id"]
+        print(f"{username}: {events}")
+        if not reassigned:
+            failures.append(f"the {username} assignee's events don't have the reassignment")
+        elif reassigned[0]["previous_assignee_id"] != user_ids["previous"]:
+            failures.append(f"the reassignment doesn't have the previous assignee: {reassigned[0]}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
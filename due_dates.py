@@ -0,0 +1,43 @@
+from datetime import timedelta
+from models import Task, STATUSES
+
+# statuses of tasks that can be overdue
+OPEN_STATUS_IDS = [id for id, status in enumerate(STATUSES) if status != "Closed"]
+
+# relative due date filters of the task search
+DUE_FILTERS = [("any", "Any"), ("overdue", "Overdue"), ("today", "Due today"), ("this_week", "Due this week"),
+               ("next_week", "Due next week")]
+
+
+def due_date_range(due_filter, today):
+    """Returns the first and last due date (None if unbounded) of a relative due date filter"""
+    monday = today - timedelta(days=today.weekday())
+    if due_filter == "overdue":
+        return None, today - timedelta(days=1)
+    if due_filter == "today":
+        return today, today
+    if due_filter == "this_week":
+        return monday, monday + timedelta(days=6)
+    if due_filter == "next_week":
+        return monday + timedelta(days=7), monday + timedelta(days=13)
+    return None, None
+
+
+def filter_tasks_by_due_date(tasks_query, today, due_filter="any", due_from=None, due_to=None):
+    """
+    Filter a sqlalchemy Tasks query to a relative due date filter of DUE_FILTERS and/or a due date range.
+    Overdue tasks are the unclosed ones due before today, the statuses are listed rather than excluding "Closed",
+    so a user's overdue tasks are a due date range in the (assignee_id, status_id, due_date) index for each status.
+    """
+    first, last = due_date_range(due_filter, today)
+    if due_filter == "overdue":
+        tasks_query = tasks_query.filter(Task.status_id.in_(OPEN_STATUS_IDS))
+
+    # the relative filter and the range both apply
+    first = max(filter(None, (first, due_from)), default=None)
+    last = min(filter(None, (last, due_to)), default=None)
+    if first:
+        tasks_query = tasks_query.filter(Task.due_date >= first)
+    if last:
+        tasks_query = tasks_query.filter(Task.due_date <= last)
+    return tasks_query
@@ -1,10 +1,12 @@
 from flask_wtf import FlaskForm
 from wtforms.validators import DataRequired, EqualTo, Length, Regexp, ValidationError, Optional
 from wtforms import StringField, PasswordField, TextAreaField, IntegerField, DateField, SelectField, HiddenField, SubmitField
-from wtforms_alchemy import model_form_factory
 from models import User, PRIORITY_LEVELS, STATUSES
+from due_dates import DUE_FILTERS
 
-BaseModelForm = model_form_factory(FlaskForm)
+# task list sort orders
+TASK_SORTS = [("due_date", "Due date"), ("newest", "Newest")]
+PAGE_SIZES = [("25", "25"), ("50", "50"), ("100", "100")]
 
 
 password_validators = [
@@ -50,8 +52,13 @@ class SearchTaskForm(FlaskForm):
     assignee = StringField('Assignee')
     assigner = StringField('Assigner')
     due_date = DateField('Due date', validators=[Optional()])
+    due = SelectField('Due', choices=DUE_FILTERS, default="any")
+    due_from = DateField('Due from', validators=[Optional()])
+    due_to = DateField('Due until', validators=[Optional()])
     priority_id = SelectField('Priority', choices=[("Any", "Any")] + list(enumerate(PRIORITY_LEVELS)))
     status_id = SelectField('Status', choices=[("Any", "Any")] + list(enumerate(STATUSES)))
+    sort = SelectField('Sort by', choices=[("relevance", "Relevance")] + TASK_SORTS, default="relevance")
+    page_size = SelectField('Results per page', choices=PAGE_SIZES, default="50")
 
 
 class CommentForm(FlaskForm):
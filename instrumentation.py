@@ -0,0 +1,190 @@
+import hmac
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, abort, g, has_app_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the request and query duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Prometheus style histogram: counts of observations up to each bucket bound, their sum and count"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        """Returns the histogram's lines in the Prometheus text format"""
+        lines = [f'{name}_bucket{{{labels},le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics:
+    """Thread-safe aggregates of the requests and SQL queries of this process, by endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status) -> number of requests
+        self.request_durations = defaultdict(Histogram)
+        self.query_durations = defaultdict(Histogram)
+        self.queries_per_request = defaultdict(lambda: Histogram((1, 2, 5, 10, 20, 50, 100)))
+        self.slow_queries = Counter()
+        self.n_plus_one = Counter()
+        self.compiled_cache = Counter()  # statements by compiled cache result, e.g. "hit", "miss"
+        # functions returning more metrics lines, e.g. of the password hashing
+        self.collectors = []
+
+    def record(self, endpoint, method, status, duration, query_durations, slow_queries, n_plus_one):
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.request_durations[endpoint].observe(duration)
+            for query_duration in query_durations:
+                self.query_durations[endpoint].observe(query_duration)
+            self.queries_per_request[endpoint].observe(len(query_durations))
+            self.slow_queries[endpoint] += slow_queries
+            self.n_plus_one[endpoint] += n_plus_one
+
+    def record_compiled_cache(self, result):
+        with self.lock:
+            self.compiled_cache[result] += 1
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format"""
+        with self.lock:
+            lines = ["# HELP http_requests_total Requests by endpoint, method and status.",
+                     "# TYPE http_requests_total counter"]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            for name, help, histograms in (
+                    ("http_request_duration_seconds", "Request durations by endpoint.", self.request_durations),
+                    ("sql_query_duration_seconds", "SQL statement durations by endpoint.", self.query_durations),
+                    ("sql_queries_per_request", "SQL statements per request by endpoint.", self.queries_per_request)):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+                for endpoint, histogram in sorted(histograms.items()):
+                    lines += histogram.lines(name, f'endpoint="{endpoint}"')
+
+            for name, help, counter in (
+                    ("sql_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS by endpoint.", self.slow_queries),
+                    ("sql_n_plus_one_total", "Requests repeating a statement N_PLUS_ONE_THRESHOLD times by endpoint.",
+                     self.n_plus_one)):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+                for endpoint, count in sorted(counter.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {count}')
+
+            lines += ["# HELP sql_compiled_cache_total SQL statements by compiled statement cache result.",
+                      "# TYPE sql_compiled_cache_total counter"]
+            for result, count in sorted(self.compiled_cache.items()):
+                lines.append(f'sql_compiled_cache_total{{result="{result}"}} {count}')
+
+        for collector in self.collectors:
+            lines += collector()
+
+        return "\n".join(lines) + "\n"
+
+
+def explain(engine, statement, parameters):
+    """Returns the database's query plan of a statement as text, from the engine (e.g. a read replica) that ran it"""
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            return "; ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    with engine.connect() as connection:
+        return "\n".join(row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+
+
+def compiled_cache_result(context):
+    """Returns whether a statement's compiled form came from the engine's compiled cache, e.g. "hit" or "miss" """
+    return getattr(context.cache_hit, "name", str(context.cache_hit)).lower().removeprefix("cache_")
+
+
+class SQLInstrumentation:
+    """
+    Counts and times the SQL statements of each request from the engine's cursor execute events.
+    Statements slower than slow_query_ms are logged with their query plan, requests running the same statement
+    n_plus_one_threshold times or more are logged as a likely N+1 pattern, and the request and query aggregates
+    are served in the Prometheus text format at /metrics to clients sending metrics_token as a bearer token (not at
+    all without a token).
+    """
+
+    def __init__(self, app, engine=None, slow_query_ms=100, n_plus_one_threshold=10, metrics_token=None):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.metrics_token = metrics_token
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.metrics = Metrics()
+
+        if engine is not None:
+            self.instrument(engine)
+        app.before_request(self.start_request)
+        app.after_request(self.end_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def instrument(self, engine):
+        """Count and time the statements of an engine, e.g. of a read replica"""
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        if context is not None:
+            self.metrics.record_compiled_cache(compiled_cache_result(context))
+        # statements of background threads (e.g. the notification writer) aren't part of a request
+        if has_app_context() and "request_start" in g:
+            g.sql_queries.append((statement, None if executemany else parameters, duration, conn.engine))
+
+    def start_request(self):
+        g.request_start = time.perf_counter()
+        g.sql_queries = []
+
+    def end_request(self, response):
+        if "request_start" not in g:
+            return response
+
+        # stop recording, so the EXPLAINs of slow queries aren't counted
+        duration = time.perf_counter() - g.pop("request_start")
+        queries = g.pop("sql_queries")
+        endpoint = request.endpoint or "unmatched"
+
+        slow_queries = [query for query in queries if query[2] >= self.slow_query_seconds]
+        for statement, parameters, query_duration, engine in slow_queries:
+            try:
+                plan = explain(engine, statement, parameters) if parameters is not None else "(executemany)"
+            except Exception as error:
+                plan = f"(EXPLAIN failed: {error})"
+            logger.warning("Slow query in %s (%.1f ms): %s\nplan: %s", endpoint, query_duration * 1000, statement, plan)
+
+        repeated = [(statement, count) for statement, count in Counter(query[0] for query in queries).items()
+                    if count >= self.n_plus_one_threshold]
+        for statement, count in repeated:
+            logger.warning("Possible N+1 in %s, statement run %d times: %s", endpoint, count, statement)
+
+        self.metrics.record(endpoint, request.method, response.status_code, duration,
+                            [query[2] for query in queries], len(slow_queries), int(bool(repeated)))
+        return response
+
+    def metrics_view(self):
+        """Serve the metrics to clients sending the metrics token, whatever their address (e.g. behind a proxy)"""
+        if not self.metrics_token or not hmac.compare_digest(
+                request.headers.get("Authorization", "").encode(), f"Bearer {self.metrics_token}".encode()):
+            abort(404)
+        return Response(self.metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,253 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import delete, false, insert, inspect, select, tuple_, update
+from background import BackgroundThread
+from models import Notification, NotificationArchive, Task, NOTIFICATION_KINDS
+
+logger = logging.getLogger(__name__)
+
+# notification texts by kind, with the acting user's name, the task's title and the number of collapsed events
+NOTIFICATION_TEMPLATES = {
+    "assigned": '{actor} assigned you task "{title}"',
+    "updated": '{actor} updated task "{title}"',
+    "status_updated": '{actor} updated task "{title}" status',
+    "commented": '{actor} commented on task "{title}"',
+    "overdue": 'Task "{title}" is overdue'
+}
+COLLAPSED_COMMENTS_TEMPLATE = '{count} new comments on task "{title}", the latest by {actor}'
+
+COMMENTED = NOTIFICATION_KINDS.index("commented")
+
+# keys of the notification dicts given to insert_notifications that render them rather than being stored
+RENDER_ONLY_KEYS = ("actor", "task_title")
+
+# columns moved to the archive
+ARCHIVE_COLUMNS = ["id", "text", "user_id", "task_id", "timestamp", "is_read", "kind", "actor_id", "count", "title"]
+
+
+def render_notification(kind, actor, title, count=1):
+    """Returns the text of a notification kind"""
+    if kind == COMMENTED and count > 1:
+        return COLLAPSED_COMMENTS_TEMPLATE.format(actor=actor, title=title, count=count)
+    return NOTIFICATION_TEMPLATES[NOTIFICATION_KINDS[kind]].format(actor=actor, title=title)
+
+
+def notification_to_dict(notification, actor=None, title=None):
+    """
+    Returns a JSON serializable dict of a sqlalchemy Notification table obj, with the text rendered from the acting
+    user's name and the task's title (unless the notification kept the title from before a rename), unless it was
+    stored
+    """
+    return {
+        "id": notification.id,
+        "text": notification.text or render_notification(notification.kind, actor, notification.title or title,
+                                                         notification.count),
+        "task_id": notification.task_id,
+        "timestamp": notification.timestamp,
+        "is_read": notification.is_read,
+        "kind": NOTIFICATION_KINDS[notification.kind] if notification.kind is not None else None,
+        "count": notification.count
+    }
+
+
+def collapse_comment_notifications(sql_session, notifications):
+    """
+    Returns notifications with the comment notifications of the same user and task collapsed into one counted
+    notification, together with the user's still unread one of the task, which is deleted. The collapsed notification
+    is inserted with a new id, above the deleted one (ids aren't reused, see Notification), so clients fetching or
+    streaming notifications after their newest id see it and replace the unread one they have.
+    """
+    collapsed = {}
+    for i, notification in enumerate(notifications):
+        key = (notification["user_id"], notification["task_id"]) if notification["kind"] == COMMENTED else i
+        if previous := collapsed.pop(key, None):
+            notification = {**notification, "count": previous.get("count", 1) + notification.get("count", 1)}
+        collapsed[key] = notification
+
+    comment_keys = [key for key in collapsed if isinstance(key, tuple)]
+    if comment_keys:
+        unread = sql_session.execute(
+            delete(Notification)
+            .where(Notification.kind == COMMENTED, Notification.is_read == false(),
+                   tuple_(Notification.user_id, Notification.task_id).in_(comment_keys))
+            .returning(Notification.user_id, Notification.task_id, Notification.count)
+        ).all()
+        for user_id, task_id, count in unread:
+            notification = collapsed[(user_id, task_id)]
+            collapsed[(user_id, task_id)] = {**notification, "count": notification.get("count", 1) + count}
+
+    return list(collapsed.values())
+
+
+def insert_notifications(sql_session, notifications):
+    """
+    Insert notifications given as dicts of Notification columns in one bulk statement, after collapsing the comment
+    notifications. The dicts also have the acting user's name ("actor") and the task's title ("task_title"), which
+    aren't stored but render the inserted notifications, returned as (user id, notification dict) to publish once
+    committed.
+    """
+    notifications = collapse_comment_notifications(sql_session, notifications)
+    inserted = sql_session.scalars(
+        insert(Notification).returning(Notification, sort_by_parameter_order=True),
+        [{column: value for column, value in notification.items() if column not in RENDER_ONLY_KEYS}
+         for notification in notifications]
+    ).all()
+    return [(notification.user_id, notification_to_dict(notification, values["actor"], values["task_title"]))
+            for notification, values in zip(inserted, notifications)]
+
+
+def keep_notification_titles(sql_session):
+    """
+    Store the previous title of the tasks being renamed in their notifications that don't have one yet, so renaming
+    a task doesn't change its past notifications. Meant to be called from an after_flush listener.
+    """
+    for obj in sql_session.dirty:
+        if not isinstance(obj, Task):
+            continue
+        history = inspect(obj).attrs.title.history
+        if history.deleted and history.added and history.deleted[0] != history.added[0]:
+            sql_session.connection().execute(
+                update(Notification)
+                .where(Notification.task_id == obj.id, Notification.title.is_(None))
+                .values(title=history.deleted[0])
+            )
+
+
+def archive_notifications(session_factory, before, batch_size=1000):
+    """
+    Move the notifications older than before to the archive table, the oldest batch_size at a time with one
+    transaction per batch, so the notifications table isn't locked for long.
+    Returns the number of archived notifications.
+    """
+    archived = 0
+    while True:
+        with session_factory() as sql_session:
+            ids = sql_session.scalars(
+                select(Notification.id).where(Notification.timestamp < before)
+                .order_by(Notification.timestamp).limit(batch_size)
+            ).all()
+            if not ids:
+                return archived
+
+            sql_session.execute(insert(NotificationArchive).from_select(
+                ARCHIVE_COLUMNS,
+                select(*(getattr(Notification, column) for column in ARCHIVE_COLUMNS)).where(Notification.id.in_(ids))
+            ))
+            sql_session.execute(delete(Notification).where(Notification.id.in_(ids)))
+            sql_session.commit()
+        archived += len(ids)
+
+
+class NotificationBroker:
+    """
+    In-process publish/subscribe of new notifications to the open notification streams of their users.
+    A subscriber that falls more than max_queue_size notifications behind is unsubscribed, its stream
+    then closes and the client reconnects and catches up from the database.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Returns a queue that receives the user's new notifications"""
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self.lock:
+            self.subscribers[user_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self.lock:
+            self.subscribers[user_id].discard(subscriber)
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+
+    def is_subscribed(self, user_id, subscriber):
+        with self.lock:
+            return subscriber in self.subscribers.get(user_id, ())
+
+    def publish(self, user_id, notification):
+        """Send a notification to all of the user's subscribers"""
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(notification)
+            except queue.Full:
+                self.unsubscribe(user_id, subscriber)
+
+    def listen(self, user_id, subscriber, heartbeat=15):
+        """
+        Yields the notifications sent to a subscriber, or None every heartbeat seconds without one.
+        Stops when the subscriber is unsubscribed.
+        """
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    if not self.is_subscribed(user_id, subscriber):
+                        return
+                    yield None
+        finally:
+            self.unsubscribe(user_id, subscriber)
+
+
+class NotificationWriter(BackgroundThread):
+    """
+    Background thread that writes queued notifications in bulk, one transaction per batch of up to batch_size
+    notifications collected for at most max_wait seconds, and publishes them to the broker once committed.
+    """
+
+    thread_name = "notification-writer"
+
+    def __init__(self, session_factory, broker, batch_size=500, max_wait=0.05):
+        super().__init__()
+        self.session_factory = session_factory
+        self.broker = broker
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+
+    def enqueue(self, notifications):
+        """Queue notifications given as dicts of Notification columns"""
+        for notification in notifications:
+            self.queue.put(notification)
+        self.start()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception("Failed to write %d notifications", len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, batch):
+        with self.session_factory() as sql_session:
+            published = insert_notifications(sql_session, batch)
+            sql_session.commit()
+
+        for user_id, notification in published:
+            self.broker.publish(user_id, notification)
+
+    def flush(self, timeout=5):
+        """Wait until the queued notifications are written"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
@@ -0,0 +1,133 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, bindparam, or_, Date, DateTime, Float, Integer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """The next page token is malformed or doesn't match the sort order"""
+
+
+def get_page_size(value):
+    """Returns a page size within [1, MAX_PAGE_SIZE] from a request parameter"""
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(sort, values):
+    """Returns an opaque url-safe next page token for the sort keys values of the last row of a page"""
+    values = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps([sort, values]).encode()).decode()
+
+
+def decode_cursor(cursor, sort, sort_keys):
+    """Returns the sort keys values stored in a next page token"""
+    try:
+        cursor_sort, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if cursor_sort != sort or len(values) != len(sort_keys):
+        raise InvalidCursor(cursor)
+
+    try:
+        return [parse_value(value, column.type) for value, (column, _) in zip(values, sort_keys)]
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def parse_value(value, column_type):
+    """Converts a JSON value from a next page token back to the column's python type"""
+    if value is None:
+        return None
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Date):
+        return date.fromisoformat(value)
+    if isinstance(column_type, Integer):
+        return int(value)
+    if isinstance(column_type, Float):
+        return float(value)
+    return value
+
+
+def after_keyset(sort_keys, values):
+    """
+    Returns a condition for rows that come after the given sort keys values, e.g. for keys (a, b)
+    a > :a OR (a = :a AND b > :b)
+    """
+    conditions = []
+    for i, (column, descending) in enumerate(sort_keys):
+        equal_previous = [previous_column == previous_value for (previous_column, _), previous_value in zip(sort_keys[:i], values[:i])]
+        after = column < values[i] if descending else column > values[i]
+        conditions.append(and_(*equal_previous, after))
+    return or_(*conditions)
+
+
+def paginate(query, sort, sort_keys, page_size, cursor=None):
+    """
+    Returns a page of rows (or entities, for single entity queries) of a sqlalchemy query ordered by
+    sort_keys and a token for the next page (None if this is the last page).
+    sort_keys is a list of (column, descending) and the last key must be unique, e.g. the primary key.
+    """
+    is_single_entity = len(query.column_descriptions) == 1
+
+    if cursor:
+        query = query.filter(after_keyset(sort_keys, decode_cursor(cursor, sort, sort_keys)))
+
+    # select the sort keys too so the next page token can be made from the last row
+    query = (query
+             .add_columns(*(column for column, _ in sort_keys))
+             .order_by(*(column.desc() if descending else column for column, descending in sort_keys))
+             .limit(page_size + 1)
+             )
+    return split_page(query.all(), sort, sort_keys, page_size, is_single_entity)
+
+
+def split_page(rows, sort, sort_keys, page_size, is_single_entity):
+    """Returns the page of rows without the extra row and sort keys columns and the next page token"""
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(sort, list(rows[-1][-len(sort_keys):]))
+
+    if is_single_entity:
+        return [row[0] for row in rows], next_cursor
+    return [tuple(row[:-len(sort_keys)]) for row in rows], next_cursor
+
+
+def keyset_statements(statement, sort_keys):
+    """
+    Returns the statements of the first and of the next pages of a select of a single entity ordered by sort_keys,
+    to build once and execute with paginate_statements().
+    The page size and the cursor's sort keys values are bound parameters, so every page reuses the statements
+    (and their compiled form) instead of building a query per request.
+    """
+    cursor_values = [bindparam(f"cursor_{i}", type_=column.type) for i, (column, _) in enumerate(sort_keys)]
+    statement = (statement
+                 .add_columns(*(column for column, _ in sort_keys))
+                 .order_by(*(column.desc() if descending else column for column, descending in sort_keys))
+                 )
+    return (statement.limit(bindparam("limit")),
+            statement.where(after_keyset(sort_keys, cursor_values)).limit(bindparam("limit")))
+
+
+def paginate_statements(sql_session, statements, sort, sort_keys, page_size, cursor=None, parameters=None):
+    """
+    Returns a page of entities of statements made by keyset_statements() executed with parameters,
+    and a token for the next page (None if this is the last page)
+    """
+    first_page_statement, next_page_statement = statements
+    parameters = dict(parameters or {}, limit=page_size + 1)
+
+    statement = first_page_statement
+    if cursor:
+        statement = next_page_statement
+        parameters.update((f"cursor_{i}", value) for i, value in enumerate(decode_cursor(cursor, sort, sort_keys)))
+
+    return split_page(sql_session.execute(statement, parameters).all(), sort, sort_keys, page_size, True)
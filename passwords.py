@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+from instrumentation import Histogram
+
+
+def timed(function, *args):
+    """Returns a function's result with the wall clock times it started and finished (run in a pool process)"""
+    started = time.time()
+    result = function(*args)
+    return result, started, time.time()
+
+
+def method_prefix(method):
+    """
+    Returns the method part of werkzeug's hashes with its defaults filled in, e.g. "scrypt" -> "scrypt:32768:8:1"
+    (hashes once, run in a pool process)
+    """
+    return generate_password_hash("", method, 1).split("$")[0]
+
+
+def get_pool_context():
+    """
+    Returns the multiprocessing context of the hashing processes. They aren't forked from the app's process,
+    which runs threads, but from a fork server that preloads this module (or spawned where there is none).
+    Like with spawn, each new process still imports the main module of the app's process (as "__mp_main__"),
+    so scripts that start the pool must guard their code with if __name__ == "__main__".
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords with werkzeug's hashing on a pool of max_workers processes, so the CPU-bound
+    hashing doesn't hold the GIL of the worker threads serving pages, and at most max_workers passwords are
+    hashed at once. With max_workers 0, passwords are hashed in the calling thread.
+    A pool broken by the death of one of its processes is replaced, and a password is hashed in the calling thread
+    if the new pool breaks too.
+    Hashes made with another method or salt length than the configured ones are reported by needs_rehash().
+    """
+
+    def __init__(self, method="scrypt", salt_length=16, max_workers=2):
+        self.method = method
+        self.salt_length = salt_length
+        self.max_workers = max_workers
+        self.pool = None
+        self.pool_pid = None
+        # the configured method's prefix, computed in the calling thread without a pool or by a pool process
+        self.method_prefix = None
+        self.pool_restarts = 0
+        self.method_prefix_future = None
+        self.lock = threading.Lock()
+
+        # time waiting for a pool process and time hashing, by operation
+        self.wait_durations = {operation: Histogram() for operation in ("hash", "check")}
+        self.hash_durations = {operation: Histogram() for operation in ("hash", "check")}
+        self.checks = Counter()
+
+    def get_pool(self, broken=None):
+        """
+        Returns the process pool, started lazily so forking servers start one in each worker, or replacing the
+        given broken pool unless another thread already did
+        """
+        with self.lock:
+            if broken is not None and self.pool is broken:
+                broken.shutdown(wait=False)
+                self.pool = None
+                self.pool_restarts += 1
+            if self.pool is None or self.pool_pid != os.getpid():
+                self.pool = ProcessPoolExecutor(self.max_workers, mp_context=get_pool_context())
+                self.pool_pid = os.getpid()
+                # hashed by a pool process as the pool starts rather than on a request's thread by needs_rehash
+                if self.method_prefix is None:
+                    self.method_prefix_future = self.pool.submit(method_prefix, self.method)
+            return self.pool
+
+    def run(self, operation, function, *args):
+        submitted = time.time()
+        if self.max_workers:
+            pool = self.get_pool()
+            try:
+                result, started, finished = pool.submit(timed, function, *args).result()
+            except BrokenProcessPool:
+                # a pool process died (e.g. killed for memory), which breaks the whole pool: retry once on a new one
+                try:
+                    result, started, finished = self.get_pool(broken=pool).submit(timed, function, *args).result()
+                except BrokenProcessPool:
+                    result, started, finished = timed(function, *args)
+        else:
+            result, started, finished = timed(function, *args)
+
+        with self.lock:
+            self.wait_durations[operation].observe(max(started - submitted, 0))
+            self.hash_durations[operation].observe(finished - started)
+        return result
+
+    def hash(self, password):
+        return self.run("hash", generate_password_hash, password, self.method, self.salt_length)
+
+    def check(self, password_hash, password):
+        is_correct = self.run("check", check_password_hash, password_hash, password)
+        with self.lock:
+            self.checks["success" if is_correct else "failure"] += 1
+        return is_correct
+
+    def needs_rehash(self, password_hash):
+        """Returns whether a hash was made with other hashing parameters than the configured ones"""
+        if self.method_prefix is None:
+            prefix = None
+            if self.max_workers:
+                self.get_pool()
+                try:
+                    prefix = self.method_prefix_future.result()
+                except BrokenProcessPool:
+                    pass
+            # hashed in this thread without a pool or if the pool broke
+            self.method_prefix = prefix or method_prefix(self.method)
+
+        method, _, rest = password_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self.method_prefix or len(salt) != self.salt_length
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None and self.pool_pid == os.getpid():
+                self.pool.shutdown()
+            self.pool = None
+
+    def metrics_lines(self):
+        """Returns the hashing metrics in the Prometheus text format"""
+        with self.lock:
+            lines = []
+            for name, help, histograms in (
+                    ("password_hash_wait_seconds", "Time waiting for a hashing process by operation.", self.wait_durations),
+                    ("password_hash_seconds", "Time hashing by operation.", self.hash_durations)):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+                for operation, histogram in histograms.items():
+                    lines += histogram.lines(name, f'operation="{operation}"')
+
+            lines += ["# HELP password_checks_total Password checks by result.", "# TYPE password_checks_total counter"]
+            for result in ("success", "failure"):
+                lines.append(f'password_checks_total{{result="{result}"}} {self.checks[result]}')
+
+            lines += ["# HELP password_hash_pool_restarts_total Hashing pools replaced after a process died.",
+                      "# TYPE password_hash_pool_restarts_total counter",
+                      f"password_hash_pool_restarts_total {self.pool_restarts}"]
+            return lines
@@ -0,0 +1,132 @@
+import importlib
+import json
+import logging
+from datetime import date, timedelta
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from background import BackgroundThread
+from due_dates import OPEN_STATUS_IDS
+from models import Task, SchedulerCheckpoint, NOTIFICATION_KINDS
+from notifications import insert_notifications
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "due_date_reminders"
+
+
+class ReminderScheduler(BackgroundThread):
+    """
+    Background thread that sends the assignees of unclosed tasks an "overdue" notification once their due date has
+    passed, every interval seconds.
+    Tasks are scanned in (due_date, id) order from a checkpoint, the last task reminded about, so a tick only reads
+    the tasks that became overdue since the last one, batch_size at a time. Each batch's notifications and the moved
+    checkpoint are written in one transaction, and the checkpoint is only moved if no other worker moved it meanwhile,
+    so every task is reminded about once even with a scheduler running in every worker.
+    Tasks created or edited with a due date before the checkpoint aren't reminded about.
+    """
+
+    thread_name = "reminder-scheduler"
+
+    def __init__(self, session_factory, publish, interval=300, batch_size=500):
+        super().__init__()
+        self.session_factory = session_factory
+        # called with the (user id, notification dict) of the written notifications
+        self.publish = publish
+        self.interval = interval
+        self.batch_size = batch_size
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.send_reminders()
+            except Exception:
+                logger.exception("Failed to send due date reminders")
+
+    def send_reminders(self, today=None):
+        """Send the reminders of the tasks that became overdue since the checkpoint, returns their number"""
+        today = today or date.today()
+        sent = 0
+        while True:
+            with self.session_factory() as sql_session:
+                checkpoint = self.get_checkpoint(sql_session, today)
+                tasks = sql_session.execute(
+                    select(Task.id, Task.title, Task.assignee_id, Task.due_date)
+                    .where(tuple_(Task.due_date, Task.id) > tuple_(*checkpoint), Task.due_date < today,
+                           Task.status_id.in_(OPEN_STATUS_IDS))
+                    .order_by(Task.due_date, Task.id)
+                    .limit(self.batch_size)
+                ).all()
+                if not tasks:
+                    # keep a new checkpoint
+                    sql_session.commit()
+                    return sent
+
+                published = insert_notifications(sql_session, [{
+                    "user_id": assignee_id,
+                    "task_id": id,
+                    "kind": NOTIFICATION_KINDS.index("overdue"),
+                    "actor": None,
+                    "task_title": title
+                } for id, title, assignee_id, _ in tasks])
+
+                last_task = tasks[-1]
+                if not self.move_checkpoint(sql_session, checkpoint, (last_task.due_date, last_task.id)):
+                    # another worker sent these reminders
+                    sql_session.rollback()
+                    continue
+                sql_session.commit()
+
+            self.publish(published)
+            sent += len(tasks)
+            if len(tasks) < self.batch_size:
+                return sent
+
+    def get_checkpoint(self, sql_session, today):
+        """
+        Returns the (due date, id) checkpoint, starting before the tasks due yesterday, so the tasks that
+        were overdue before the scheduler first ran aren't reminded about
+        """
+        select_value = select(SchedulerCheckpoint.value).where(SchedulerCheckpoint.name == CHECKPOINT_NAME)
+        value = sql_session.scalar(select_value)
+        if value is None:
+            # another worker may create it first, then theirs is kept and read back
+            self.insert_checkpoint(sql_session, (today - timedelta(days=1), 0))
+            value = sql_session.scalar(select_value)
+        return decode(value)
+
+    def insert_checkpoint(self, sql_session, checkpoint):
+        """Insert the checkpoint unless it exists"""
+        values = {"name": CHECKPOINT_NAME, "value": encode(checkpoint)}
+        dialect_name = sql_session.get_bind().dialect.name
+        if dialect_name in ("sqlite", "postgresql"):
+            # the session's dialect module is already loaded by its engine
+            dialect = importlib.import_module(f"sqlalchemy.dialects.{dialect_name}")
+            sql_session.execute(dialect.insert(SchedulerCheckpoint).values(values).on_conflict_do_nothing(
+                index_elements=[SchedulerCheckpoint.name]))
+            return
+
+        # other databases insert in a savepoint, rolled back if another worker inserted it first
+        try:
+            with sql_session.begin_nested():
+                sql_session.execute(insert(SchedulerCheckpoint).values(values))
+        except IntegrityError:
+            pass
+
+    def move_checkpoint(self, sql_session, checkpoint, new_checkpoint):
+        """Move the checkpoint unless it isn't checkpoint anymore, returns whether it was moved"""
+        result = sql_session.execute(
+            update(SchedulerCheckpoint)
+            .where(SchedulerCheckpoint.name == CHECKPOINT_NAME, SchedulerCheckpoint.value == encode(checkpoint))
+            .values(value=encode(new_checkpoint))
+        )
+        return result.rowcount == 1
+
+
+def encode(checkpoint):
+    due_date, id = checkpoint
+    return json.dumps([due_date.isoformat(), id])
+
+
+def decode(value):
+    due_date, id = json.loads(value)
+    return date.fromisoformat(due_date), id
@@ -0,0 +1,66 @@
+import logging
+import random
+import sqlite3
+from sqlalchemy import Delete, Insert, Update
+from sqlalchemy.orm import Session
+from background import BackgroundThread
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingSession(Session):
+    """
+    Session that runs its statements on one of the replica engines while info["use_replica"] is set (e.g. by
+    read-only routes), and on the primary engine otherwise. Flushes and insert, update and delete statements always
+    run on the primary and set info["wrote"], so the writer can be sent to the primary for a while afterwards.
+    """
+
+    def __init__(self, *args, replicas=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = list(replicas)
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info["wrote"] = True
+        elif self.replicas and self.info.get("use_replica"):
+            # stay on the same replica for the whole session, so its reads are consistent
+            if (replica := self.info.get("replica")) is None:
+                replica = self.info["replica"] = random.choice(self.replicas)
+            return replica
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+class SQLiteBackupReplica(BackgroundThread):
+    """
+    A copy of a SQLite database refreshed every interval seconds with SQLite's online backup, for trying out
+    replica routing locally. Reads from the copy lag at most interval seconds (plus the backup's duration) behind.
+    """
+
+    thread_name = "sqlite-backup-replica"
+
+    def __init__(self, primary_path, replica_path, interval=5):
+        super().__init__()
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.interval = interval
+
+    def backup(self):
+        """Copy the primary database to the replica file"""
+        primary = sqlite3.connect(self.primary_path)
+        replica = sqlite3.connect(self.replica_path, timeout=30)
+        try:
+            primary.backup(replica)
+        finally:
+            replica.close()
+            primary.close()
+
+    def before_start(self):
+        """Make the first copy before the thread keeps refreshing it"""
+        self.backup()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.backup()
+            except Exception:
+                logger.exception("Failed to refresh the replica %s", self.replica_path)
@@ -0,0 +1,51 @@
+"""
+Set-up shared by the check and benchmark scripts: a temporary directory holding the app's SQLite database, and test
+clients of registered or logged in users.
+"""
+import os
+import tempfile
+
+# the password of the users the scripts register, it passes the registration form's rules
+PASSWORD = "Check-pass1!"
+
+
+def temporary_environment(database_name, hash_in_thread=True, keep_database_url=False, **environment):
+    """
+    Returns a new temporary directory and the environment of an app using a SQLite database file named database_name
+    in it (or the database of DATABASE_URL if keep_database_url and it's set), with the given variables on top.
+    Passwords are hashed in the calling thread if hash_in_thread, unless PASSWORD_HASH_WORKERS is set, so the scripts
+    don't start hashing processes.
+    Run the app in the directory, so files written by the app (e.g. sessions) stay out of the working directory.
+    """
+    directory = tempfile.mkdtemp()
+    variables = {"DATABASE_URL": f"sqlite:///{os.path.join(directory, database_name)}"}
+    if keep_database_url and os.environ.get("DATABASE_URL"):
+        del variables["DATABASE_URL"]
+    if hash_in_thread:
+        variables["PASSWORD_HASH_WORKERS"] = os.environ.get("PASSWORD_HASH_WORKERS", "0")
+    return directory, dict(os.environ, **variables, **environment)
+
+
+def use_temporary_environment(database_name, **options):
+    """
+    Set up this process like temporary_environment() (which takes the same options) before the app is created, and
+    move into the directory, returns it
+    """
+    directory, environment = temporary_environment(database_name, **options)
+    os.environ.update(environment)
+    os.chdir(directory)
+    return directory
+
+
+def register_client(app, username, password=PASSWORD):
+    """Returns a test client of the app logged in as a newly registered user"""
+    client = app.test_client()
+    client.post("/register", data={"username": username, "password": password, "confirmation": password})
+    return client
+
+
+def login_client(app, username, password=PASSWORD):
+    """Returns a test client of the app logged in as an existing user"""
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": password})
+    return client
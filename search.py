@@ -0,0 +1,105 @@
+import re
+from sqlalchemy import inspect, func, literal_column, table, column, or_
+from models import Task
+
+# inverted index over task titles and descriptions
+# SQLite: an external-content FTS5 table kept in sync with triggers
+# PostgreSQL: a GIN index over the tasks' tsvector
+SQLITE_SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description, content='tasks', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END"""
+]
+
+# the indexed expression, queries must use exactly the same expression to use the index
+POSTGRESQL_TASK_DOCUMENT = "to_tsvector('english', tasks.title || ' ' || coalesce(tasks.description, ''))"
+
+POSTGRESQL_SEARCH_INDEX_DDL = [
+    f"CREATE INDEX IF NOT EXISTS tasks_search_index ON tasks USING GIN (({POSTGRESQL_TASK_DOCUMENT}))"
+]
+
+tasks_fts = table("tasks_fts", column("rowid"), column("rank"))
+
+
+def create_search_index(connection):
+    """Create the full-text search index for tasks and fill it with the existing tasks"""
+    dialect = connection.dialect.name
+
+    if dialect == "sqlite":
+        is_new = not inspect(connection).has_table("tasks_fts")
+        for ddl in SQLITE_SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(ddl)
+        # index tasks created before the search index existed
+        if is_new:
+            connection.exec_driver_sql("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+    elif dialect == "postgresql":
+        for ddl in POSTGRESQL_SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(ddl)
+
+
+def search_terms(search_text):
+    """Split the searched text into words"""
+    return re.findall(r"\w+", search_text)
+
+
+def postgresql_text_query(terms):
+    """Returns a tsquery matching every term as a prefix, e.g. fix:* & log:*"""
+    return func.to_tsquery(literal_column("'english'"), " & ".join(f"{term}:*" for term in terms))
+
+
+def filter_tasks_by_text(tasks_query, search_text):
+    """
+    Filter a sqlalchemy Tasks query to tasks whose title or description contain words starting
+    with every searched word
+    """
+    terms = search_terms(search_text)
+    if not terms:
+        return tasks_query.filter(False)
+
+    dialect = tasks_query.session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        # every term is quoted and matched as a prefix, e.g. "fix"* "log"*
+        match = " ".join(f'"{term}"*' for term in terms)
+        return (tasks_query
+                .join(tasks_fts, tasks_fts.c.rowid == Task.id)
+                .filter(literal_column("tasks_fts").op("MATCH")(match))
+                )
+
+    if dialect == "postgresql":
+        document = literal_column(POSTGRESQL_TASK_DOCUMENT)
+        return tasks_query.filter(document.op("@@")(postgresql_text_query(terms)))
+
+    # databases without a full-text index fall back to a table scan
+    for term in terms:
+        tasks_query = tasks_query.filter(or_(Task.title.ilike(f"%{term}%"), Task.description.ilike(f"%{term}%")))
+    return tasks_query
+
+
+def text_search_rank(tasks_query, search_text):
+    """
+    Returns an expression that orders the tasks of a query filtered by filter_tasks_by_text best match first
+    (None if the database can't rank matches)
+    """
+    dialect = tasks_query.session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        # bm25 score, lower is better
+        return tasks_fts.c.rank
+
+    terms = search_terms(search_text)
+    if dialect == "postgresql" and terms:
+        return -func.ts_rank(literal_column(POSTGRESQL_TASK_DOCUMENT), postgresql_text_query(terms))
+
+    return None
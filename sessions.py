@@ -0,0 +1,136 @@
+import secrets
+import time
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession
+from cache import LRUCache, SQLiteStore, MISSING
+
+# where the user sessions are kept
+# cookie: Flask's signed cookie (the session only holds the user id, username, flashes and the CSRF token)
+# memory: in-process LRU cache, sessions aren't shared between worker processes
+# sqlite: a table in a local SQLite file shared by the workers of a node, expired sessions are swept periodically
+# redis: Flask-Session's Redis store (requires the redis package)
+# filesystem: Flask-Session's file per session store
+SESSION_BACKENDS = ("cookie", "memory", "sqlite", "redis", "filesystem")
+
+
+class StoreSession(SecureCookieSession):
+    """Session whose data is kept server-side under a random session id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+        # whether the session gets a new id when it's saved
+        self.regenerate = False
+
+    def clear(self):
+        # sessions are cleared on log in, log out and register, a new id keeps an id planted before from carrying
+        # over to the logged in user (session fixation)
+        super().clear()
+        self.regenerate = True
+
+
+class StoreSessionInterface(SessionInterface):
+    """
+    Keeps sessions in a key-value store with get/set/delete (an LRUCache or a SQLiteStore) and only the
+    session id in the cookie. Sessions are only written when they change.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, sweep_interval=None):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self.swept_at = time.monotonic()
+
+    def open_session(self, app, request):
+        if sid := request.cookies.get(self.get_cookie_name(app)):
+            if (data := self.store.get(sid)) is not MISSING:
+                return StoreSession(self.serializer.loads(data), sid=sid)
+        return StoreSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """Give a session a new id when it's saved and delete the old one, like Flask-Session's regenerate"""
+        session.regenerate = True
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        self.sweep()
+
+        if session.regenerate:
+            if not session.new:
+                self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # delete emptied sessions
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        self.store.set(session.sid, self.serializer.dumps(dict(session)))
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def sweep(self):
+        """Delete the expired sessions from stores that don't evict them themselves"""
+        if self.sweep_interval is None or time.monotonic() - self.swept_at < self.sweep_interval:
+            return
+        self.swept_at = time.monotonic()
+        self.store.sweep()
+
+
+def regenerate_session(app, session):
+    """
+    Give the session a new id when a user logs in, so an id planted before login can't be used to act as them
+    (session fixation). Signed cookie sessions have no id to fix.
+    """
+    if hasattr(app.session_interface, "regenerate"):
+        app.session_interface.regenerate(session)
+
+
+def init_sessions(app):
+    """Set up the session backend chosen by the SESSION_BACKEND config"""
+    backend = app.config["SESSION_BACKEND"]
+    lifetime = int(app.permanent_session_lifetime.total_seconds())
+
+    if backend == "cookie":
+        # Flask's default session interface
+        return
+
+    if backend == "memory":
+        app.session_interface = StoreSessionInterface(LRUCache(max_size=app.config["SESSION_MEMORY_SIZE"], ttl=lifetime))
+
+    elif backend == "sqlite":
+        app.session_interface = StoreSessionInterface(
+            SQLiteStore(app.config["SESSION_SQLITE_PATH"], table="sessions", ttl=lifetime),
+            sweep_interval=app.config["SESSION_SWEEP_INTERVAL"]
+        )
+
+    elif backend in ("redis", "filesystem"):
+        from flask_session import Session
+
+        app.config["SESSION_TYPE"] = backend
+        if backend == "redis":
+            import redis
+            app.config["SESSION_REDIS"] = redis.Redis.from_url(app.config["SESSION_REDIS_URL"])
+        Session(app)
+
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}, expected one of {SESSION_BACKENDS}")
@@ -1,19 +1,37 @@
 // Get autocomplete suggestions for assignee input field
 $(function() {
-    $('#assignee').on('input', function() {
-        let inputValue = $(this).val().trim();
-        
-        if (inputValue) {
+    // suggestions by typed text
+    const cache = {};
+
+    $('#assignee').autocomplete({
+        // wait for the user to stop typing before requesting suggestions
+        delay: 250,
+        source: function(request, response) {
+            let inputValue = request.term.trim();
+
+            if (!inputValue) {
+                response([]);
+                return;
+            }
+
+            if (inputValue in cache) {
+                response(cache[inputValue]);
+                return;
+            }
+
             $.ajax({
                 url: '/get_users',
                 data: { name: inputValue },
                 dataType: 'json',
                 success: function(userNames) {
-                    $('#assignee').autocomplete({
-                        source: userNames
-                    });
+                    cache[inputValue] = userNames;
+                    response(userNames);
+                },
+                error: function() {
+                    cache[inputValue] = [];
+                    response([]);
                 }
             });
         }
     });
-});
\ No newline at end of file
+});
@@ -1,19 +1,37 @@
 // Get autocomplete suggestions for assigner input field
 $(function() {
-    $('#assigner').on('input', function() {
-        let inputValue = $(this).val().trim();
-        
-        if (inputValue) {
+    // suggestions by typed text
+    const cache = {};
+
+    $('#assigner').autocomplete({
+        // wait for the user to stop typing before requesting suggestions
+        delay: 250,
+        source: function(request, response) {
+            let inputValue = request.term.trim();
+
+            if (!inputValue) {
+                response([]);
+                return;
+            }
+
+            if (inputValue in cache) {
+                response(cache[inputValue]);
+                return;
+            }
+
             $.ajax({
                 url: '/get_users',
                 data: { name: inputValue },
                 dataType: 'json',
                 success: function(userNames) {
-                    $('#assigner').autocomplete({
-                        source: userNames
-                    });
+                    cache[inputValue] = userNames;
+                    response(userNames);
+                },
+                error: function() {
+                    cache[inputValue] = [];
+                    response([]);
                 }
             });
         }
     });
-});
\ No newline at end of file
+});
@@ -0,0 +1,65 @@
+// Load a task's comments incrementally and post new comments without reloading the page
+// The page shows the newest comments, older ones are fetched a page at a time
+$(function() {
+    const container = $('#comments-container');
+    const taskId = container.data('task-id');
+
+    function renderComment(comment) {
+        return $('<div>')
+            .addClass('comment')
+            .attr('data-comment-id', comment.id)
+            .append($('<div>')
+                .addClass('my-header')
+                .append($('<p>').addClass('comment-user').text(comment.username))
+                .append($('<p>').addClass('my-timestamp').text(comment.timestamp))
+            )
+            .append($('<p>').addClass('comment-text').text(comment.text));
+    }
+
+    function commentIds() {
+        return container.children('.comment').map(function() {
+            return $(this).data('comment-id');
+        }).get();
+    }
+
+    // Prepend the page of comments before the oldest shown one
+    $('#load-older-comments').on('click', function() {
+        const button = $(this).prop('disabled', true);
+        $.getJSON('/get_comments', { task_id: taskId, before_id: commentIds()[0] }, function(data) {
+            container.prepend(data.comments.map(renderComment));
+            button.prop('disabled', false).toggle(data.has_more);
+        }).fail(() => button.prop('disabled', false));
+    });
+
+    // Append the comments after the newest shown one, including those others posted meanwhile
+    function loadNewerComments() {
+        const ids = commentIds();
+        const params = { task_id: taskId };
+        if (ids.length) {
+            params.after_id = ids[ids.length - 1];
+        }
+
+        $.getJSON('/get_comments', params, function(data) {
+            container.append(data.comments.map(renderComment));
+            if (data.has_more) {
+                loadNewerComments();
+            }
+        });
+    }
+
+    $('#comment-form').on('submit', function(event) {
+        event.preventDefault();
+        const form = $(this);
+
+        $.ajax({
+            url: form.attr('action'),
+            type: 'POST',
+            data: form.serialize(),
+            dataType: 'json',
+            success: function() {
+                form.find('textarea, input[type="text"]').val('');
+                loadNewerComments();
+            }
+        });
+    });
+});
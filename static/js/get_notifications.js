@@ -1,26 +1,82 @@
 // Populate the notifications drop-down menu
+// The newest notifications are fetched once, then new ones are pushed by the server over Server-Sent Events
 $(function() {
-    $('#notification-toggle').on('click', function() {       
-        $.ajax({
-            url: '/get_notifications',
-            success: function(notifications) {
-                const notificationList = $('#notification-container');
-                notificationList.empty(); // Clear previous notifications
-                
-                // Populate the notification list with fetched notifications
-                notifications.forEach(notification => {
-                    const link = $('<a>')
-                        .addClass('dropdown-item')
-                        .attr('href', `/show_task?id=${notification.task_id}`)
-                        .html(`<div class="notification">
-                                    ${notification.timestamp}
-                                    <h6>${notification.text}</h6>
-                                </div>`
-                        );
-
-                    notificationList.append(link);
-                });
-            }
+    if (!$('#notification-toggle').length) {
+        return; // not logged in
+    }
+
+    let notifications = []; // newest first
+    let lastId = 0;
+
+    // Show the number of unread notifications on the bell
+    function renderCount() {
+        const unread = notifications.filter(notification => !notification.is_read).length;
+        $('#notification-count').text(unread ? unread : '');
+    }
+
+    function renderNotifications() {
+        const notificationList = $('#notification-container');
+        notificationList.empty(); // Clear previous notifications
+
+        // Populate the notification list with the received notifications
+        notifications.forEach(notification => {
+            const link = $('<a>')
+                .addClass('dropdown-item')
+                .attr('href', `/show_task?id=${notification.task_id}`)
+                .append($('<div>')
+                    .addClass('notification')
+                    .toggleClass('fw-bold', !notification.is_read)
+                    .text(notification.timestamp)
+                    .append($('<h6>').text(notification.text))
+                );
+
+            notificationList.append(link);
         });
+    }
+
+    function addNotification(notification) {
+        if (notification.id > lastId) {
+            lastId = notification.id;
+        }
+        // a collapsed comment notification replaces the unread one of the task, which the server deleted
+        if (notification.kind === 'commented' && notification.count > 1) {
+            notifications = notifications.filter(other =>
+                !(other.kind === 'commented' && other.task_id === notification.task_id && !other.is_read));
+        }
+        notifications.unshift(notification);
+        renderCount();
+    }
+
+    function listen() {
+        const source = new EventSource(`/notifications/stream?after_id=${lastId}`);
+        source.onmessage = function(event) {
+            addNotification(JSON.parse(event.data));
+        };
+    }
+
+    $.ajax({
+        url: '/get_notifications',
+        success: function(newestNotifications) {
+            newestNotifications.reverse().forEach(addNotification);
+            listen();
+        }
+    });
+
+    $('#notification-toggle').on('click', function() {
+        renderNotifications();
+
+        // Mark the shown notifications as read
+        if (notifications.some(notification => !notification.is_read)) {
+            $.ajax({
+                url: '/read_notifications',
+                method: 'POST',
+                data: { up_to_id: lastId },
+                headers: { 'X-CSRFToken': $('meta[name="csrf-token"]').attr('content') },
+                success: function() {
+                    notifications.forEach(notification => notification.is_read = true);
+                    renderCount();
+                }
+            });
+        }
     });
 });
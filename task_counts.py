@@ -0,0 +1,120 @@
+import importlib
+from collections import Counter
+from sqlalchemy import delete, func, inspect, insert, literal, select, update
+from models import Task, TaskCount, TASK_ROLES, STATUSES
+
+# columns of a task that determine which counts it is in
+COUNTED_COLUMNS = ("assignee_id", "assigner_id", "status_id", "priority_id")
+
+
+def task_count_keys(values):
+    """
+    Returns the (user id, role, status id, priority id) counts a task with the given column values is in.
+    The ids are converted to int, as forms set them as strings and the deltas of an unchanged value must cancel out.
+    """
+    return [(int(values[f"{role}_id"]), role, int(values["status_id"]), int(values["priority_id"])) for role in TASK_ROLES]
+
+
+def task_count_deltas(sql_session):
+    """
+    Returns a Counter of the changes to the task counts made by the tasks being flushed.
+    Meant to be called from an after_flush listener, while the session still holds the flushed changes.
+    """
+    deltas = Counter()
+
+    for obj in sql_session.new:
+        if isinstance(obj, Task):
+            deltas.update(task_count_keys({column: getattr(obj, column) for column in COUNTED_COLUMNS}))
+
+    for obj in sql_session.dirty | sql_session.deleted:
+        if not isinstance(obj, Task):
+            continue
+
+        state = inspect(obj)
+        current_values = {column: getattr(obj, column) for column in COUNTED_COLUMNS}
+        previous_values = {}
+        for column in COUNTED_COLUMNS:
+            history = state.attrs[column].history
+            previous_values[column] = history.deleted[0] if history.deleted else current_values[column]
+
+        deltas.subtract(task_count_keys(previous_values))
+        if obj not in sql_session.deleted:
+            deltas.update(task_count_keys(current_values))
+
+    # drop the counts a change moved a task out of and back into
+    return Counter({key: delta for key, delta in deltas.items() if delta})
+
+
+def apply_task_count_deltas(connection, deltas):
+    """Add the deltas to the task counts, in the transaction of the connection"""
+    rows = [{"user_id": user_id, "role": role, "status_id": status_id, "priority_id": priority_id, "count": delta}
+            for (user_id, role, status_id, priority_id), delta in deltas.items()]
+    if not rows:
+        return
+
+    if connection.dialect.name in ("sqlite", "postgresql"):
+        # the connection's dialect module is already loaded by its engine, importing both up front costs ~90 ms
+        dialect = importlib.import_module(f"sqlalchemy.dialects.{connection.dialect.name}")
+        statement = dialect.insert(TaskCount)
+        statement = statement.on_conflict_do_update(
+            index_elements=[TaskCount.user_id, TaskCount.role, TaskCount.status_id, TaskCount.priority_id],
+            set_={"count": TaskCount.count + statement.excluded["count"]}
+        )
+        connection.execute(statement, rows)
+        return
+
+    # other databases update the existing counts and insert the missing ones
+    for row in rows:
+        result = connection.execute(
+            update(TaskCount)
+            .where(TaskCount.user_id == row["user_id"], TaskCount.role == row["role"],
+                   TaskCount.status_id == row["status_id"], TaskCount.priority_id == row["priority_id"])
+            .values(count=TaskCount.count + row["count"])
+        )
+        if not result.rowcount:
+            connection.execute(insert(TaskCount).values(**row))
+
+
+def rebuild_task_counts(connection):
+    """Recount all tasks, e.g. when the task counts table is added to an existing database"""
+    connection.execute(delete(TaskCount))
+    for role in TASK_ROLES:
+        user_id = getattr(Task, f"{role}_id")
+        connection.execute(insert(TaskCount).from_select(
+            ["user_id", "role", "status_id", "priority_id", "count"],
+            select(user_id, literal(role), Task.status_id, Task.priority_id, func.count())
+            .group_by(user_id, Task.status_id, Task.priority_id)
+        ))
+
+
+def get_task_counts(sql_session, user_id):
+    """
+    Returns the number of tasks of a user per role, by status and by priority id:
+    {role: {"status": {status id: count}, "priority": {priority id: count}, "total": count}}.
+    Reads at most roles x statuses x priorities rows of the task counts, regardless of the number of tasks.
+    """
+    counts = {role: {"status": Counter(), "priority": Counter(), "total": 0} for role in TASK_ROLES}
+
+    rows = sql_session.execute(
+        select(TaskCount.role, TaskCount.status_id, TaskCount.priority_id, TaskCount.count)
+        .where(TaskCount.user_id == user_id)
+    )
+    for role, status_id, priority_id, count in rows:
+        counts[role]["status"][status_id] += count
+        counts[role]["priority"][priority_id] += count
+        counts[role]["total"] += count
+
+    return counts
+
+
+def get_overdue_count(sql_session, user_id, today):
+    """
+    Returns the number of unclosed tasks assigned to a user that are past their due date.
+    Overdue changes with the date rather than with the tasks, so it is counted from the (assignee_id, due_date, id,
+    status_id) index instead of being maintained, reading only the index entries of the user's overdue tasks.
+    """
+    return sql_session.scalar(
+        select(func.count())
+        .select_from(Task)
+        .where(Task.assignee_id == user_id, Task.due_date < today, Task.status_id != STATUSES.index("Closed"))
+    )
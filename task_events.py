@@ -0,0 +1,105 @@
+from datetime import date
+from sqlalchemy import inspect, select, update
+from models import Task, TaskEvent
+
+# columns of a task whose changes are logged
+LOGGED_COLUMNS = ("title", "description", "due_date", "assignee_id", "assigner_id", "priority_id", "status_id")
+# the task_events columns of the users a user's events are read by
+USER_COLUMNS = ("assignee_id", "assigner_id", "previous_assignee_id", "previous_assigner_id")
+
+
+def event_value(value):
+    """Returns a column value as logged: a string, with dates in ISO format"""
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def created_event(task_id, assignee_id, assigner_id, actor_id=None):
+    """Returns the task_events row of a created task"""
+    # every row has the same keys, as the rows are inserted in one executemany
+    return {"task_id": task_id, "field": "created", "old_value": None, "new_value": None, "actor_id": actor_id,
+            "assignee_id": assignee_id, "assigner_id": assigner_id, "previous_assignee_id": None,
+            "previous_assigner_id": None}
+
+
+def task_events(sql_session, actor_id=None):
+    """
+    Returns the task_events rows of the tasks being flushed: an event for each new task and for each changed
+    column of the updated tasks, with its old and new value. The events of an update reassigning a task also have
+    its previous assignee or assigner, so the users it was taken from see the change in their events.
+    Meant to be called from an after_flush listener, while the session still holds the flushed changes.
+    """
+    events = [created_event(obj.id, obj.assignee_id, obj.assigner_id, actor_id)
+              for obj in sql_session.new if isinstance(obj, Task)]
+
+    for obj in sql_session.dirty:
+        if not isinstance(obj, Task):
+            continue
+
+        state = inspect(obj)
+        previous = {}
+        for column in ("assignee_id", "assigner_id"):
+            history = state.attrs[column].history
+            old_value = history.deleted[0] if history.deleted else None
+            changed = history.added and event_value(old_value) != event_value(history.added[0])
+            previous[f"previous_{column}"] = old_value if changed else None
+
+        for column in LOGGED_COLUMNS:
+            history = state.attrs[column].history
+            if not history.added:
+                continue
+            old_value = event_value(history.deleted[0] if history.deleted else None)
+            new_value = event_value(history.added[0])
+            # columns set to their current value aren't changes
+            if old_value != new_value:
+                events.append({"task_id": obj.id, "field": column, "old_value": old_value, "new_value": new_value,
+                               "actor_id": actor_id, "assignee_id": obj.assignee_id, "assigner_id": obj.assigner_id,
+                               **previous})
+
+    return events
+
+
+def get_task_events(sql_session, since=0, limit=1000, user_id=None):
+    """
+    Returns up to limit task events with an id greater than since, in id order, only of the tasks assigned to or
+    by user_id (as of the change, or before it if the change reassigned the task) if given. Consumers sync
+    incrementally by passing the id of the last event they got as since. Ids follow commit order on SQLite, which runs
+    one write transaction at a time.
+    """
+    statement = select(TaskEvent).where(TaskEvent.id > since).order_by(TaskEvent.id).limit(limit)
+    if user_id is None:
+        return sql_session.scalars(statement).all()
+
+    # the events of each role are read in order from their (user id, id) index rather than with an OR over the
+    # user's tasks, then merged; the events of a task assigned to oneself are in several
+    events = {event.id: event for column in USER_COLUMNS
+              for event in sql_session.scalars(statement.where(getattr(TaskEvent, column) == user_id))}
+    return [events[id] for id in sorted(events)[:limit]]
+
+
+def fill_event_users(connection):
+    """Copy the assignee and assigner of the tasks to their events logged before task_events had these columns"""
+    for column in ("assignee_id", "assigner_id"):
+        connection.execute(
+            update(TaskEvent)
+            .where(getattr(TaskEvent, column).is_(None))
+            .values({column: select(getattr(Task, column)).where(Task.id == TaskEvent.task_id).scalar_subquery()})
+        )
+
+
+def event_to_dict(event):
+    """Returns a JSON serializable dict of a TaskEvent"""
+    return {
+        "id": event.id,
+        "task_id": event.task_id,
+        "field": event.field,
+        "old_value": event.old_value,
+        "new_value": event.new_value,
+        "actor_id": event.actor_id,
+        "assignee_id": event.assignee_id,
+        "assigner_id": event.assigner_id,
+        "previous_assignee_id": event.previous_assignee_id,
+        "previous_assigner_id": event.previous_assigner_id,
+        "timestamp": str(event.timestamp)
+    }